@@ -0,0 +1,156 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# Alerts are kept this long, and never more than RECENT_ALERTS_MAX of them
+RECENT_ALERTS_HOURS = float(os.getenv("RECENT_ALERTS_HOURS", 1))
+RECENT_ALERTS_MAX = int(os.getenv("RECENT_ALERTS_MAX", 100000))
+
+# Indexed alert fields
+INDEXED_FIELDS = ["ipsrc", "dport", "predicted_class"]
+
+
+class RecentAlertStore:
+    """
+    Bounded in-memory store of recent alerts for dashboard drill-down.
+
+    Alerts are kept in arrival order under increasing sequence numbers, with
+    secondary indexes from source IP, destination port and class to the
+    sequence numbers of their alerts. Queries walk the smallest matching
+    index newest first, so a filtered page costs about its own size.
+    Alerts older than the store covers are left to MongoDB.
+    """
+
+    def __init__(self, max_age: float = RECENT_ALERTS_HOURS * 3600, capacity: int = RECENT_ALERTS_MAX):
+        self.max_age = max_age
+        self.capacity = capacity
+
+        self._alerts: Dict[int, Dict[str, Any]] = {}
+        self._order: Deque[tuple] = deque()  # (sequence, timestamp)
+        self._indexes: Dict[str, Dict[Any, Deque[int]]] = {field: {} for field in INDEXED_FIELDS}
+        self._next_sequence = 0
+        # Everything since this time is in the store
+        self.covered_since = time.time()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    @staticmethod
+    def _key(field: str, value: Any) -> Any:
+        # Ports arrive as numbers or strings
+        if field == "dport" and value is not None:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                pass
+        return value
+
+    def add(self, alerts: List[Dict[str, Any]]):
+        """
+        Add alerts in arrival order and evict the ones out of bounds
+
+        :param alerts: Non-normal results with a unix timestamp in seconds
+        """
+        if not alerts:
+            return
+        now = time.time()
+        with self._lock:
+            for alert in alerts:
+                timestamp = alert.get("timestamp")
+                if not isinstance(timestamp, (int, float)):
+                    timestamp = now
+                sequence = self._next_sequence
+                self._next_sequence += 1
+
+                self._alerts[sequence] = alert
+                self._order.append((sequence, timestamp))
+                for field in INDEXED_FIELDS:
+                    value = alert.get(field)
+                    if value is not None:
+                        index = self._indexes[field]
+                        key = self._key(field, value)
+                        if key not in index:
+                            index[key] = deque()
+                        index[key].append(sequence)
+            self._evict(now)
+
+    def _evict(self, now: float):
+        cutoff = now - self.max_age
+        while self._order and (len(self._order) > self.capacity or self._order[0][1] < cutoff):
+            sequence, timestamp = self._order.popleft()
+            alert = self._alerts.pop(sequence)
+            self.covered_since = max(self.covered_since, timestamp)
+            # The evicted alert is the oldest in each of its indexes
+            for field in INDEXED_FIELDS:
+                value = alert.get(field)
+                if value is None:
+                    continue
+                key = self._key(field, value)
+                entries = self._indexes[field][key]
+                entries.popleft()
+                if not entries:
+                    del self._indexes[field][key]
+
+    def covers(self, start: float) -> bool:
+        """True if every alert since start is in the store"""
+        return start > self.covered_since
+
+    def query(self, start: float, end: float, filters: Optional[Dict[str, Any]] = None,
+              limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Recent alerts matching all filters, newest first
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param filters: Values of indexed fields (ipsrc, dport, predicted_class)
+        :param limit: Page size
+        :param offset: Matching alerts skipped
+        :return: Page of alerts
+        """
+        filters = {field: self._key(field, value)
+                   for field, value in (filters or {}).items() if value is not None}
+        with self._lock:
+            # Walk the most selective index, or everything without filters
+            candidates = None
+            for field, value in filters.items():
+                entries = self._indexes[field].get(value)
+                if entries is None:
+                    return []
+                if candidates is None or len(entries) < len(candidates):
+                    candidates = entries
+            if candidates is None:
+                candidates = (sequence for sequence, _ in reversed(self._order))
+            else:
+                candidates = reversed(candidates)
+
+            page = []
+            for sequence in candidates:
+                alert = self._alerts[sequence]
+                timestamp = alert.get("timestamp")
+                if isinstance(timestamp, (int, float)):
+                    if timestamp >= end:
+                        continue
+                    if timestamp < start:
+                        break
+                if any(self._key(field, alert.get(field)) != value for field, value in filters.items()):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                page.append(alert)
+                if len(page) >= limit:
+                    break
+            return page
+
+
+# Global recent alert store
+alert_store = RecentAlertStore()
@@ -0,0 +1,184 @@
+# Alert analytics aggregated in MongoDB, only summaries leave the database
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+router = APIRouter(prefix="/analytics")
+
+# Results are cached this long, default ranges are aligned to it so repeated calls hit the cache
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", 10))
+ANALYTICS_CACHE_MAX_ENTRIES = 256
+
+# Alert fields the top endpoint can group by
+TOP_FIELDS = ["ipsrc", "ipdst", "dport", "service", "protocol_type"]
+
+_cache: Dict[Tuple, Tuple[float, Any]] = {}
+
+
+async def _cached(key: Tuple, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Result of compute(), reused for ANALYTICS_CACHE_TTL_SECONDS per key
+    """
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    value = await compute()
+    if len(_cache) >= ANALYTICS_CACHE_MAX_ENTRIES:
+        for stale in [k for k, (expires, _) in _cache.items() if expires <= now]:
+            del _cache[stale]
+        if len(_cache) >= ANALYTICS_CACHE_MAX_ENTRIES:
+            _cache.clear()
+    _cache[key] = (now + ANALYTICS_CACHE_TTL_SECONDS, value)
+    return value
+
+
+def _time_range(start: Optional[float], end: Optional[float]) -> Tuple[float, float]:
+    """Validated range, defaulting to the last hour"""
+    if end is None:
+        now = time.time()
+        end = now - now % ANALYTICS_CACHE_TTL_SECONDS + ANALYTICS_CACHE_TTL_SECONDS
+    start = start if start is not None else end - 3600
+    if start >= end:
+        raise HTTPException(
+            status_code=400,
+            detail="'from' must be earlier than 'to'"
+        )
+    return start, end
+
+@router.get("/alerts/timeline")
+async def get_alerts_timeline(
+    request: Request,
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds), default 1 hour ago"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    step: int = Query(60, gt=0, description="Bucket size in seconds")
+):
+    """
+    Alerts per class per time bucket
+
+    Parameters:
+    - from: Range start as unix timestamp in seconds (default: 1 hour ago)
+    - to: Range end as unix timestamp in seconds (default: now)
+    - step: Bucket size in seconds (default: 60)
+
+    Returns:
+    - Buckets with timestamp, total and count per class
+    """
+    start, end = _time_range(start, end)
+    try:
+        buckets = await _cached(
+            ("timeline", start, end, step),
+            lambda: request.app.mongodb.get_alerts_timeline(start, end, step))
+        return {"from": start, "to": end, "step": step, "buckets": buckets}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve alert timeline: {str(e)}"
+        )
+
+@router.get("/alerts/top")
+async def get_alerts_top(
+    request: Request,
+    by: str = Query("ipsrc", pattern=f"^({'|'.join(TOP_FIELDS)})$", description="Field to rank"),
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds), default 1 hour ago"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    limit: int = Query(10, gt=0, le=1000, description="Number of entries")
+):
+    """
+    Top attackers, attacked ports, targets or services over a time range
+
+    Parameters:
+    - by: ipsrc (attackers), dport (attacked ports), ipdst, service or protocol_type
+    - from: Range start as unix timestamp in seconds (default: 1 hour ago)
+    - to: Range end as unix timestamp in seconds (default: now)
+    - limit: Number of entries (default: 10)
+
+    Returns:
+    - Values by descending alert count, with their classes and last occurrence
+    """
+    start, end = _time_range(start, end)
+    try:
+        top = await _cached(
+            ("top", by, start, end, limit),
+            lambda: request.app.mongodb.get_alerts_top(start, end, by, limit))
+        return {"from": start, "to": end, "by": by, "top": top}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve top alert {by}: {str(e)}"
+        )
+
+@router.get("/targets")
+async def get_targets(
+    request: Request,
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds), default 1 hour ago"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    limit: int = Query(20, gt=0, le=1000, description="Number of targets")
+):
+    """
+    Most attacked destination addresses, broken down by class
+
+    Parameters:
+    - from: Range start as unix timestamp in seconds (default: 1 hour ago)
+    - to: Range end as unix timestamp in seconds (default: now)
+    - limit: Number of targets (default: 20)
+
+    Returns:
+    - Targets with total, count per class, first and last occurrence
+    """
+    start, end = _time_range(start, end)
+    try:
+        targets = await _cached(
+            ("targets", start, end, limit),
+            lambda: request.app.mongodb.get_alerts_by_target(start, end, limit))
+        return {"from": start, "to": end, "targets": targets}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve targets: {str(e)}"
+        )
+
+@router.get("/targets/{ipdst}")
+async def get_target(
+    request: Request,
+    ipdst: str,
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds), default 1 hour ago"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    limit: int = Query(10, gt=0, le=1000, description="Entries per top list")
+):
+    """
+    Breakdown of the alerts against one target
+
+    Parameters:
+    - ipdst: Target address
+    - from: Range start as unix timestamp in seconds (default: 1 hour ago)
+    - to: Range end as unix timestamp in seconds (default: now)
+    - limit: Entries per top list (default: 10)
+
+    Returns:
+    - Count per class, top attackers and top attacked ports of the target
+    """
+    start, end = _time_range(start, end)
+
+    async def breakdown() -> Dict[str, Any]:
+        mongodb = request.app.mongodb
+        summary = await mongodb.get_alerts_by_target(start, end, 1, ipdst)
+        return {
+            "summary": summary[0] if summary else {"ipdst": ipdst, "total": 0, "classes": {}},
+            "top_attackers": await mongodb.get_alerts_top(start, end, "ipsrc", limit, ipdst),
+            "top_ports": await mongodb.get_alerts_top(start, end, "dport", limit, ipdst),
+        }
+
+    try:
+        target = await _cached(("target", ipdst, start, end, limit), breakdown)
+        return {"from": start, "to": end, **target}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve target {ipdst}: {str(e)}"
+        )
@@ -0,0 +1,66 @@
+# Admin-only diagnostics: sampling profiler and event loop lag
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+import asyncio
+import hmac
+import os
+from dotenv import load_dotenv
+from app.diagnostics import sample_stacks, format_collapsed, format_stats, loop_monitors
+load_dotenv()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Only allow requests carrying the ADMIN_TOKEN, the debug endpoints do not
+    exist when no token is configured
+    """
+    admin_token = os.getenv("ADMIN_TOKEN", "")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+router = APIRouter(prefix="/debug", dependencies=[Depends(require_admin)])
+
+# Only one profile runs at a time
+_profile_lock = asyncio.Lock()
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(5, gt=0, le=60, description="Sampling duration in seconds"),
+    format: str = Query("collapsed", pattern="^(collapsed|stats)$", description="collapsed or stats"),
+    thread: Optional[List[str]] = Query(None, description="Thread name prefixes to sample, e.g. rmq-consumer, predict-")
+):
+    """
+    Sample the stacks of the consumer loop, inference and other threads
+
+    Parameters:
+    - seconds: Sampling duration (default: 5, max: 60)
+    - format: "collapsed" stacks (flamegraph input) or a pstats-like "stats" table
+    - thread: Thread name prefixes to restrict sampling to (repeatable)
+
+    Returns:
+    - Profile as plain text
+    """
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with _profile_lock:
+        counts = await asyncio.to_thread(sample_stacks, seconds, 0.005, thread)
+
+    if format == "stats":
+        return format_stats(counts)
+    return format_collapsed(counts)
+
+@router.get("/loop-lag")
+async def loop_lag():
+    """
+    Event loop lag of the web server and consumer loops
+
+    Returns:
+    - Last, max and average lag in milliseconds per loop
+    """
+    return {name: monitor.metrics() for name, monitor in loop_monitors.items()}
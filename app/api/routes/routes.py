@@ -1,10 +1,13 @@
 # REST API for testing model and network statistics
 
 from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from app.models.model import predict
+import time
+from app.models.batching import prediction_batcher, predict_ndjson_stream, PREDICT_BULK_CHUNK_SIZE
 from app.network_statistics import network_stats_service
+from app.alert_store import alert_store
 
 router = APIRouter()
 
@@ -16,7 +19,7 @@ async def predict_route(data: NetworkDataPayload):
     try:
         input_data_list = data.data
         
-        results = predict(input_data_list)
+        results = await prediction_batcher.submit(input_data_list)
         
         return results
     
@@ -29,6 +32,22 @@ async def predict_route(data: NetworkDataPayload):
             detail=f"Prediction failed: {str(e)}"
         )
 
+@router.post("/predict/bulk")
+async def predict_bulk_route(
+    request: Request,
+    chunk_size: int = Query(PREDICT_BULK_CHUNK_SIZE, gt=0, le=10000, description="Rows scored per model call")
+):
+    """
+    Score an NDJSON body (one feature object per line) in chunks
+
+    Returns:
+    - NDJSON stream with one prediction (or error object) per input line
+    """
+    return StreamingResponse(
+        predict_ndjson_stream(request.stream(), chunk_size),
+        media_type="application/x-ndjson"
+    )
+
 @router.get("/network-statistics")
 async def get_network_statistics(request: Request):
     """
@@ -49,6 +68,57 @@ async def get_network_statistics(request: Request):
             detail=f"Failed to retrieve network statistics: {str(e)}"
         )
 
+@router.get("/network-statistics/rates")
+async def get_network_statistics_rates():
+    """
+    Retrieve live traffic rates from memory
+
+    Returns:
+    - Packets, bytes, alerts and per-class counts per second over the last
+      1, 5 and 15 minutes, with exponentially weighted averages
+    """
+    try:
+        return network_stats_service.rates.snapshot()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve network statistics rates: {str(e)}"
+        )
+
+@router.get("/network-statistics/history")
+async def get_network_statistics_history(
+    request: Request,
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds), default 1 hour ago"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    step: int = Query(60, gt=0, description="Step size in seconds")
+):
+    """
+    Retrieve network statistics over time from the minute/hour/day rollups
+
+    Parameters:
+    - from: Range start as unix timestamp in seconds (default: 1 hour ago)
+    - to: Range end as unix timestamp in seconds (default: now)
+    - step: Step size in seconds (default: 60), rounded to the rollup used
+
+    Returns:
+    - Rollup used, effective step and the counters per step
+    """
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 3600
+    if start >= end:
+        raise HTTPException(
+            status_code=400,
+            detail="'from' must be earlier than 'to'"
+        )
+
+    try:
+        return await request.app.mongodb.get_network_statistics_history(start, end, step)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve network statistics history: {str(e)}"
+        )
+
 @router.get("/packets")
 async def get_packets():
     """
@@ -86,3 +156,52 @@ async def get_non_normal_packets(
             status_code=500,
             detail=f"Failed to retrieve non-normal packets: {str(e)}"
         )
+
+@router.get("/alerts/recent")
+async def get_recent_alerts(
+    request: Request,
+    minutes: Optional[float] = Query(10, gt=0, description="Time range in minutes, ignored when 'from' is given"),
+    start: Optional[float] = Query(None, alias="from", description="Range start (unix seconds)"),
+    end: Optional[float] = Query(None, alias="to", description="Range end (unix seconds), default now"),
+    ipsrc: Optional[str] = Query(None, description="Source address"),
+    dport: Optional[int] = Query(None, description="Destination port"),
+    predicted_class: Optional[str] = Query(None, alias="class", description="Predicted class"),
+    limit: int = Query(100, gt=0, le=1000, description="Page size"),
+    offset: int = Query(0, ge=0, description="Alerts skipped")
+):
+    """
+    Recent alerts with filters and pagination, newest first
+
+    Served from the in-memory recent alert store when it covers the range,
+    from MongoDB otherwise.
+
+    Parameters:
+    - minutes: Time range in minutes (default: 10)
+    - from / to: Explicit range as unix timestamps in seconds
+    - ipsrc, dport, class: Optional filters
+    - limit, offset: Pagination
+
+    Returns:
+    - Source of the page (memory or mongodb), the alerts and the next offset
+    """
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - minutes * 60
+    filters = {"ipsrc": ipsrc, "dport": dport, "predicted_class": predicted_class}
+
+    try:
+        if alert_store.covers(start):
+            source = "memory"
+            alerts = alert_store.query(start, end, filters, limit, offset)
+        else:
+            source = "mongodb"
+            alerts = await request.app.mongodb.get_alerts(start, end, filters, limit, offset)
+        return {
+            "source": source,
+            "alerts": alerts,
+            "next_offset": offset + len(alerts) if len(alerts) == limit else None
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve recent alerts: {str(e)}"
+        )
@@ -0,0 +1,151 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+from app.network_statistics import network_stats_service
+load_dotenv()
+
+router = APIRouter()
+logger = logging.getLogger("websocket")
+
+# Base tick of the stream, clients can ask for any multiple of it
+WS_STATS_TICK_SECONDS = float(os.getenv("WS_STATS_TICK_SECONDS", 1.0))
+WS_STATS_TOP_N = int(os.getenv("WS_STATS_TOP_N", 10))
+# Give up on a client that takes longer than this to accept a message
+WS_STATS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_STATS_SEND_TIMEOUT_SECONDS", 5))
+
+
+def diff_statistics(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Delta between two statistics snapshots. Scalars and changed entries of
+    the nested tables go to "set", entries that left a table to "unset".
+
+    :param previous: Snapshot the client has
+    :param current: New snapshot
+    :return: {"set": {...}, "unset": {...}}, both empty if nothing changed
+    """
+    changed: Dict[str, Any] = {}
+    removed: Dict[str, Any] = {}
+    for field, value in current.items():
+        old_value = previous.get(field)
+        if isinstance(value, dict):
+            old_value = old_value or {}
+            entries = {key: entry for key, entry in value.items() if old_value.get(key) != entry}
+            if entries:
+                changed[field] = entries
+            gone = [key for key in old_value if key not in value]
+            if gone:
+                removed[field] = gone
+        elif value != old_value:
+            changed[field] = value
+    return {"set": changed, "unset": removed}
+
+
+class _StatsClient:
+    def __init__(self, websocket: WebSocket, interval: float):
+        self.websocket = websocket
+        self.interval = interval
+        self.state: Dict[str, Any] = {}
+        self.seq = 0
+        self.next_send = 0.0
+
+
+class StatsStreamer:
+    """
+    Pushes live statistics to dashboards: a full snapshot on connect, then
+    deltas of what changed since the client's previous message.
+
+    One ticker computes the live statistics once per tick for all clients;
+    each client is only sent a delta when its own interval has elapsed, so
+    slow dashboards can ask for fewer, larger updates. Compression is left to
+    permessage-deflate, negotiated by the server (uvicorn --ws-per-message-deflate).
+    """
+
+    def __init__(self, tick: float = WS_STATS_TICK_SECONDS, top_n: int = WS_STATS_TOP_N):
+        self.tick = tick
+        self.top_n = top_n
+        self.clients: Dict[WebSocket, _StatsClient] = {}
+        self._ticker: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return network_stats_service.get_live_statistics(self.top_n)
+
+    async def connect(self, websocket: WebSocket, interval: float):
+        """
+        Accept a client and send it the full snapshot
+        """
+        await websocket.accept()
+        client = _StatsClient(websocket, max(interval, self.tick))
+        client.state = self.snapshot()
+        await websocket.send_json({"type": "snapshot", "seq": client.seq, "data": client.state})
+
+        loop = asyncio.get_running_loop()
+        client.next_send = loop.time() + client.interval
+        self.clients[websocket] = client
+        logger.info(f"New statistics stream. Total streams: {len(self.clients)}")
+
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._run())
+
+    def disconnect(self, websocket: WebSocket):
+        """
+        Remove a client, the ticker stops with the last one
+        """
+        self.clients.pop(websocket, None)
+        logger.info(f"Statistics stream closed. Remaining streams: {len(self.clients)}")
+        if not self.clients and self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    async def _send_delta(self, client: _StatsClient, current: Dict[str, Any]):
+        delta = diff_statistics(client.state, current)
+        if not delta["set"] and not delta["unset"]:
+            return
+        client.seq += 1
+        try:
+            await asyncio.wait_for(
+                client.websocket.send_json({"type": "delta", "seq": client.seq, **delta}),
+                timeout=WS_STATS_SEND_TIMEOUT_SECONDS)
+            client.state = current
+        except Exception as e:
+            logger.error(f"Error sending statistics delta: {e}")
+            self.disconnect(client.websocket)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.clients:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            due = [client for client in self.clients.values() if client.next_send <= now]
+            if not due:
+                continue
+
+            current = self.snapshot()
+            for client in due:
+                client.next_send = now + client.interval
+            await asyncio.gather(*(self._send_delta(client, current) for client in due))
+
+
+@router.websocket("/ws/stats")
+async def stats_websocket_endpoint(
+    websocket: WebSocket,
+    interval: float = Query(WS_STATS_TICK_SECONDS, description="Seconds between deltas")
+):
+    """
+    WebSocket stream of live network statistics
+
+    Sends {"type": "snapshot", "data": {...}} on connect, then
+    {"type": "delta", "seq": n, "set": {...}, "unset": {...}} at most every
+    `interval` seconds (never faster than the server tick).
+    """
+    await streamer.connect(websocket, interval)
+    try:
+        while True:
+            # Keep connection open, clients don't need to send anything
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        streamer.disconnect(websocket)
+
+streamer = StatsStreamer()
@@ -1,21 +1,163 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Set
+import asyncio
 import json
 import logging
+import os
+from dotenv import load_dotenv
+from app.networks import NetworkSet, parse_ip, parse_port
+from app.severity import CLASS_SEVERITY, SEVERITY_BY_NAME
+load_dotenv()
 
 router = APIRouter()
 logger = logging.getLogger("websocket")
 
+# Messages waiting for the web server loop, the oldest are dropped when full
+WS_OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", 1000))
+
+class Subscription:
+    """
+    Alert filter of a single client, compiled from its subscribe message.
+    Severities are folded into the class set so that the class part can be
+    answered by the manager's class index; the remaining checks are cheap
+    comparisons and a binary search over the client's CIDR ranges.
+    """
+
+    def __init__(self, classes: Optional[Iterable[str]] = None,
+                 severities: Optional[Iterable[str]] = None,
+                 min_confidence: float = 0.0,
+                 networks: Optional[Iterable[str]] = None,
+                 ports: Optional[Iterable[int]] = None):
+        self.classes: Optional[Set[str]] = set(classes) if classes else None
+        if severities:
+            levels = {SEVERITY_BY_NAME[severity] for severity in severities}
+            by_severity = {cls for cls, level in CLASS_SEVERITY.items() if level in levels}
+            self.classes = by_severity if self.classes is None else self.classes & by_severity
+
+        self.min_confidence = float(min_confidence)
+        self.networks: Optional[NetworkSet] = NetworkSet(networks) if networks else None
+        self.ports: Optional[Set[int]] = {int(port) for port in ports} if ports else None
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "Subscription":
+        """
+        Build a subscription from a client message like
+        {"type": "subscribe", "classes": ["U2R"], "severities": ["high"],
+         "min_confidence": 0.9, "networks": ["10.0.0.0/8"], "ports": [22]}
+
+        :raises ValueError: on unknown severities, bad CIDRs or ports
+        """
+        def as_list(value):
+            return [value] if isinstance(value, (str, int)) else value
+
+        try:
+            return cls(classes=as_list(message.get("classes")),
+                       severities=as_list(message.get("severities")),
+                       min_confidence=message.get("min_confidence", 0.0),
+                       networks=as_list(message.get("networks")),
+                       ports=as_list(message.get("ports")))
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"invalid subscription: {e}")
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "classes": sorted(self.classes) if self.classes is not None else None,
+            "min_confidence": self.min_confidence,
+            "networks": self.networks.cidrs if self.networks is not None else None,
+            "ports": sorted(self.ports) if self.ports is not None else None,
+        }
+
+    def matches(self, message: Dict[str, Any], src: int, dst: int) -> bool:
+        """Check the non-class parts of the filter, addresses are pre-parsed"""
+        if message.get("confidence", 0.0) < self.min_confidence:
+            return False
+        # Ports arrive as numbers or strings
+        if self.ports is not None and parse_port(message.get("dport")) not in self.ports \
+                and parse_port(message.get("sport")) not in self.ports:
+            return False
+        if self.networks is not None and src not in self.networks and dst not in self.networks:
+            return False
+        return True
+
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
 
+        # Subscription filters and the class index: clients filtering on
+        # classes are listed per class, all others in the unfiltered set
+        self.subscriptions: Dict[WebSocket, Subscription] = {}
+        self._by_class: Dict[str, Set[WebSocket]] = {}
+        self._any_class: Set[WebSocket] = set()
+        self._network_filters = 0
+
+        # Loop owning the WebSocket objects and the outbox drained on it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+        self.dropped_messages = 0
+
+    def start(self):
+        """
+        Bind the manager to the running (web server) loop and start sending
+        published messages from it
+        """
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue(maxsize=WS_OUTBOX_SIZE)
+        self._sender = asyncio.create_task(self._send_outbox())
+
+    async def stop(self):
+        """
+        Stop sending published messages
+        """
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+
+    def publish(self, messages: List[Dict[str, Any]]):
+        """
+        Hand messages over for broadcasting. Safe to call from any thread or
+        loop, costs a single hand-off per call and never waits on clients.
+        """
+        if not messages or self._loop is None:
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._enqueue(messages)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, messages)
+
+    def _enqueue(self, messages: List[Dict[str, Any]]):
+        for message in messages:
+            if self._outbox.full():
+                self._outbox.get_nowait()
+                self.dropped_messages += 1
+                if self.dropped_messages % 1000 == 1:
+                    logger.warning(f"WebSocket outbox full, dropped {self.dropped_messages} messages so far")
+            self._outbox.put_nowait(message)
+
+    async def _send_outbox(self):
+        while True:
+            message = await self._outbox.get()
+            if self.active_connections:
+                await self.broadcast(message)
+
     async def connect(self, websocket: WebSocket):
         """
         Connect a new WebSocket connection
         """
         await websocket.accept()
         self.active_connections.append(websocket)
+        self._any_class.add(websocket)
         logger.info(f"New WebSocket connection. Total connections: {len(self.active_connections)}")
 
     def disconnect(self, websocket: WebSocket):
@@ -23,15 +165,68 @@ class ConnectionManager:
         Disconnect a WebSocket connection
         """
         self.active_connections.remove(websocket)
+        self._unindex(websocket)
         logger.info(f"WebSocket disconnected. Remaining connections: {len(self.active_connections)}")
 
-    async def broadcast(self, message: str):
+    def subscribe(self, websocket: WebSocket, subscription: Optional[Subscription]):
+        """
+        Set (or with None, clear) the alert filter of a connection
+        """
+        self._unindex(websocket)
+        if subscription is None:
+            self._any_class.add(websocket)
+            return
+
+        self.subscriptions[websocket] = subscription
+        if subscription.classes is None:
+            self._any_class.add(websocket)
+        else:
+            for cls in subscription.classes:
+                self._by_class.setdefault(cls, set()).add(websocket)
+        if subscription.networks is not None:
+            self._network_filters += 1
+
+    def _unindex(self, websocket: WebSocket):
+        self._any_class.discard(websocket)
+        subscription = self.subscriptions.pop(websocket, None)
+        if subscription is None:
+            return
+        if subscription.classes is not None:
+            for cls in subscription.classes:
+                subscribers = self._by_class.get(cls)
+                if subscribers is not None:
+                    subscribers.discard(websocket)
+                    if not subscribers:
+                        del self._by_class[cls]
+        if subscription.networks is not None:
+            self._network_filters -= 1
+
+    async def broadcast(self, message: Dict[str, Any]):
         """
-        Broadcast a message to all connections
+        Send a message to the connections whose subscription matches it.
+        The message is serialized once, and only if anyone receives it.
+        Must run on the loop owning the connections, use publish from elsewhere.
         """
-        for connection in self.active_connections:
+        candidates = list(self._any_class)
+        candidates.extend(self._by_class.get(message.get("predicted_class"), ()))
+        if not candidates:
+            return
+
+        # Addresses are only parsed when some client filters on networks
+        src = dst = None
+        if self._network_filters:
+            src = parse_ip(message.get("ipsrc"))
+            dst = parse_ip(message.get("ipdst"))
+
+        payload = None
+        for connection in candidates:
+            subscription = self.subscriptions.get(connection)
+            if subscription is not None and not subscription.matches(message, src, dst):
+                continue
             try:
-                await connection.send_json(message)
+                if payload is None:
+                    payload = json.dumps(message, separators=(",", ":"))
+                await connection.send_text(payload)
             except Exception as e:
                 logger.error(f"Error broadcasting message: {e}")
 
@@ -39,12 +234,27 @@ class ConnectionManager:
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for IDS alerts and updates
+
+    Clients receive every alert until they send a filter:
+    {"type": "subscribe", "classes": [...], "severities": [...],
+     "min_confidence": 0.9, "networks": ["10.0.0.0/8"], "ports": [22]}
+    {"type": "unsubscribe"} restores the unfiltered stream.
     """
     await manager.connect(websocket)
     try:
         while True:
-            # Keep connection open, but don't expect client to send messages
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                request = json.loads(text)
+                if request.get("type") == "subscribe":
+                    subscription = Subscription.from_message(request)
+                    manager.subscribe(websocket, subscription)
+                    await websocket.send_json({"type": "subscribed", "filter": subscription.describe()})
+                elif request.get("type") == "unsubscribe":
+                    manager.subscribe(websocket, None)
+                    await websocket.send_json({"type": "unsubscribed"})
+            except (ValueError, AttributeError) as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
@@ -0,0 +1,350 @@
+"""
+Columnar archive of every scored result on local disk.
+
+Results are buffered by hour and written by a background thread as zstd
+compressed Parquet segments in hive style partitions:
+
+    <ARCHIVE_PATH>/date=2024-05-01/hour=13/part-1714568400123-0.parquet
+
+Old partitions are removed by age and, past a size budget, oldest first.
+``query()`` only opens the partitions overlapping a time range and pushes
+column filters down to the Parquet reader.
+
+Every segment is written with the same explicit schema (ARCHIVE_COLUMNS), so
+a key missing from some rows is stored as null instead of being dropped and
+a column keeps its type across segments. Keys outside the schema are not
+archived.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# Archive root, the archiver is disabled when empty
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "")
+# Result batches waiting for the writer, batches are dropped when it is full
+ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", 256))
+# A segment is written once this many rows are buffered or the oldest is this old
+ARCHIVE_SEGMENT_ROWS = int(os.getenv("ARCHIVE_SEGMENT_ROWS", 50000))
+ARCHIVE_FLUSH_SECONDS = float(os.getenv("ARCHIVE_FLUSH_SECONDS", 60))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+# Retention, whichever limit is hit first
+ARCHIVE_RETENTION_HOURS = float(os.getenv("ARCHIVE_RETENTION_HOURS", 7 * 24))
+ARCHIVE_MAX_BYTES = int(float(os.getenv("ARCHIVE_MAX_GB", 10)) * 1024 ** 3)
+
+# Archived columns and their Arrow types
+ARCHIVE_COLUMNS = {
+    "timestamp": "float64",
+    "ipsrc": "string",
+    "ipdst": "string",
+    "sport": "int64",
+    "dport": "int64",
+    "protocol_type": "string",
+    "service": "string",
+    "flag": "string",
+    "len": "int64",
+    "predicted_class": "string",
+    "confidence": "float64",
+    "flood_hold": "bool",
+    "t1": "float64",
+    "t2": "float64",
+    "t3": "float64",
+}
+
+# Partition of an hour: ("2024-05-01", "13")
+Partition = Tuple[str, str]
+
+_CONVERTERS = {"float64": float, "int64": int, "string": str, "bool": bool}
+
+
+def archive_schema(extra_columns: Optional[Dict[str, str]] = None):
+    """
+    Arrow schema of archived rows
+
+    :param extra_columns: Additional columns and their types, appended to ARCHIVE_COLUMNS
+    :return: pyarrow Schema
+    """
+    import pyarrow as pa
+
+    columns = {**ARCHIVE_COLUMNS, **(extra_columns or {})}
+    return pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns.items()])
+
+
+def archive_table(rows: List[Dict[str, Any]], extra_columns: Optional[Dict[str, str]] = None):
+    """
+    Table of result rows with the archive schema
+
+    Values are converted to their column type, missing and unconvertible
+    ones become null.
+
+    :param rows: Result dictionaries
+    :param extra_columns: Additional columns and their types
+    :return: pyarrow Table
+    """
+    import pyarrow as pa
+
+    def convert(value: Any, converter) -> Any:
+        if value is None:
+            return None
+        try:
+            return converter(value)
+        except (TypeError, ValueError):
+            return None
+
+    columns = {**ARCHIVE_COLUMNS, **(extra_columns or {})}
+    data = {}
+    for name, type_name in columns.items():
+        converter = _CONVERTERS[type_name]
+        data[name] = [convert(row.get(name), converter) for row in rows]
+    return pa.Table.from_pydict(data, schema=archive_schema(extra_columns))
+
+
+def _partition(timestamp: float) -> Partition:
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%d"), moment.strftime("%H")
+
+
+def _partition_start(partition: Partition) -> float:
+    date, hour = partition
+    moment = datetime.strptime(f"{date} {hour}", "%Y-%m-%d %H")
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TrafficArchiver:
+    """
+    Appends scored results to compressed columnar segment files.
+
+    ``append()`` only enqueues and never blocks the consumer; buffering,
+    encoding, compression, file IO and retention all run on the writer thread.
+    """
+
+    def __init__(self, path: str = ARCHIVE_PATH,
+                 queue_size: int = ARCHIVE_QUEUE_SIZE,
+                 segment_rows: int = ARCHIVE_SEGMENT_ROWS,
+                 flush_seconds: float = ARCHIVE_FLUSH_SECONDS,
+                 retention_hours: float = ARCHIVE_RETENTION_HOURS,
+                 max_bytes: int = ARCHIVE_MAX_BYTES):
+        self.path = path
+        self.segment_rows = segment_rows
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_hours * 3600
+        self.max_bytes = max_bytes
+
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._buffers: Dict[Partition, List[Dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        self._oldest = 0.0
+        self._sequence = 0
+
+        self.written_rows = 0
+        self.dropped_rows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self):
+        """Start the writer thread, disables the archiver if pyarrow is missing"""
+        if not self.enabled or self._thread is not None:
+            return
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.error("ARCHIVE_PATH is set but pyarrow is not installed, archiving disabled")
+            self.path = ""
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="traffic-archiver", daemon=True)
+        self._thread.start()
+        logger.info(f"Archiving scored traffic to {self.path}")
+
+    def stop(self, timeout: float = 30):
+        """Write everything buffered and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def append(self, results: List[Dict[str, Any]]):
+        """
+        Hand a batch of scored results to the writer
+
+        :param results: Scored results, copied by reference and not modified
+        """
+        if self._thread is None or not results:
+            return
+        try:
+            self._queue.put_nowait(results)
+        except queue.Full:
+            self.dropped_rows += len(results)
+            logger.warning(f"Archive queue full, dropped {len(results)} results")
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                batch = []
+
+            if batch is None:
+                self._flush()
+                return
+
+            now = time.time()
+            for result in batch:
+                timestamp = result.get("timestamp")
+                if not isinstance(timestamp, (int, float)):
+                    # Queries filter on timestamp, rows without one get the archive time
+                    timestamp = now
+                    result = {**result, "timestamp": now}
+                self._buffers.setdefault(_partition(timestamp), []).append(result)
+            if batch and not self._buffered_rows:
+                self._oldest = now
+            self._buffered_rows += len(batch)
+
+            if self._buffered_rows >= self.segment_rows or \
+                    (self._buffered_rows and now - self._oldest >= self.flush_seconds):
+                self._flush()
+
+    def _flush(self):
+        import pyarrow.parquet as pq
+
+        buffers, self._buffers = self._buffers, {}
+        self._buffered_rows = 0
+        for (date, hour), rows in buffers.items():
+            try:
+                directory = os.path.join(self.path, f"date={date}", f"hour={hour}")
+                os.makedirs(directory, exist_ok=True)
+                name = f"part-{int(time.time() * 1000)}-{self._sequence}.parquet"
+                self._sequence += 1
+
+                table = archive_table(rows)
+                temp_path = os.path.join(directory, f".{name}.tmp")
+                pq.write_table(table, temp_path, compression=ARCHIVE_COMPRESSION)
+                os.replace(temp_path, os.path.join(directory, name))
+                self.written_rows += len(rows)
+            except Exception as e:
+                logger.error(f"Failed to write archive segment for {date} {hour}h: {e}")
+
+        try:
+            self._enforce_retention()
+        except Exception as e:
+            logger.error(f"Failed to apply archive retention: {e}")
+
+    def partitions(self) -> List[Tuple[Partition, str]]:
+        """
+        Partitions on disk, oldest first
+
+        :return: List of ((date, hour), directory)
+        """
+        found = []
+        if not self.path or not os.path.isdir(self.path):
+            return found
+        for date_dir in os.listdir(self.path):
+            if not date_dir.startswith("date="):
+                continue
+            date_path = os.path.join(self.path, date_dir)
+            for hour_dir in os.listdir(date_path):
+                if hour_dir.startswith("hour="):
+                    partition = (date_dir[5:], hour_dir[5:])
+                    found.append((partition, os.path.join(date_path, hour_dir)))
+        return sorted(found)
+
+    def _enforce_retention(self):
+        cutoff = time.time() - self.retention_seconds
+        remaining = []
+        for partition, directory in self.partitions():
+            # A partition expires once its whole hour is past the cutoff
+            if _partition_start(partition) + 3600 <= cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                remaining.append(directory)
+
+        files = []
+        for directory in remaining:
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".parquet"):
+                    file_path = os.path.join(directory, name)
+                    files.append((file_path, os.path.getsize(file_path)))
+
+        total = sum(size for _, size in files)
+        for file_path, size in files:
+            if total <= self.max_bytes:
+                break
+            os.remove(file_path)
+            total -= size
+
+        # Drop directories left empty
+        for directory in remaining:
+            if not os.listdir(directory):
+                os.rmdir(directory)
+                parent = os.path.dirname(directory)
+                if not os.listdir(parent):
+                    os.rmdir(parent)
+
+    def query(self, start: float, end: float,
+              columns: Optional[List[str]] = None,
+              filters: Optional[Dict[str, Any]] = None):
+        """
+        Read archived results of a time range
+
+        Only partitions overlapping the range are opened. The time range and
+        the column filters are pushed down to the Parquet reader, so row
+        groups that cannot match are skipped.
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param columns: Columns to read, all when omitted
+        :param filters: Column equality filters, a list value matches any of its items
+        :return: pyarrow Table of the matching rows
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        files = []
+        for partition, directory in self.partitions():
+            partition_start = _partition_start(partition)
+            if partition_start + 3600 <= start or partition_start >= end:
+                continue
+            files.extend(os.path.join(directory, name)
+                         for name in sorted(os.listdir(directory)) if name.endswith(".parquet"))
+        if not files:
+            return pa.table({})
+
+        dataset = ds.dataset(files, format="parquet", schema=archive_schema())
+        expression = (ds.field("timestamp") >= start) & (ds.field("timestamp") < end)
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                expression &= ds.field(column).isin(list(value))
+            else:
+                expression &= ds.field(column) == value
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Writer counters
+
+        :return: Dictionary of written, dropped and queued figures
+        """
+        return {
+            "enabled": self.enabled,
+            "written_rows": self.written_rows,
+            "dropped_rows": self.dropped_rows,
+            "queued_batches": self._queue.qsize(),
+        }
+
+
+# Global archiver instance
+archiver = TrafficArchiver()
@@ -0,0 +1,144 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.5))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", 100))
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: how late a sleep of a fixed interval wakes up.
+    A busy or blocked loop shows up as lag, which is logged past a threshold.
+    """
+
+    def __init__(self, name: str, interval: float = LOOP_LAG_INTERVAL_SECONDS,
+                 threshold_ms: float = LOOP_LAG_WARN_MS):
+        self.name = name
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+
+        self.thread_name: Optional[str] = None
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+        self.samples = 0
+        self.over_threshold = 0
+
+    async def run(self):
+        """Measure lag until cancelled"""
+        loop = asyncio.get_running_loop()
+        self.thread_name = threading.current_thread().name
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, loop.time() - expected) * 1000
+
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self.total_lag_ms += lag_ms
+            self.samples += 1
+            if lag_ms > self.threshold_ms:
+                self.over_threshold += 1
+                logger.warning(f"Event loop '{self.name}' lagging by {lag_ms:.1f} ms")
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Current lag metrics
+
+        :return: Dictionary with last, max and average lag in milliseconds
+        """
+        return {
+            "thread": self.thread_name,
+            "last_lag_ms": round(self.last_lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "avg_lag_ms": round(self.total_lag_ms / self.samples, 3) if self.samples else 0.0,
+            "samples": self.samples,
+            "over_threshold": self.over_threshold,
+            "threshold_ms": self.threshold_ms,
+        }
+
+
+# Lag monitors by loop name, filled in at startup
+loop_monitors: Dict[str, LoopLagMonitor] = {}
+
+
+def _collapse(frame, thread_name: str) -> str:
+    """Collapsed stack of a frame, root first, in flamegraph format"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+def sample_stacks(seconds: float, interval: float = 0.005,
+                  threads: Optional[Iterable[str]] = None) -> Counter:
+    """
+    Sample the stacks of all (or the named) threads for a while
+
+    :param seconds: Sampling duration
+    :param interval: Pause between samples
+    :param threads: Thread names or name prefixes to sample, all when omitted
+    :return: Counter of collapsed stacks
+    """
+    own_id = threading.get_ident()
+    prefixes = tuple(threads) if threads else None
+    counts: Counter = Counter()
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            name = names.get(thread_id, f"thread-{thread_id}")
+            if prefixes and not name.startswith(prefixes):
+                continue
+            counts[_collapse(frame, name)] += 1
+        time.sleep(interval)
+
+    return counts
+
+
+def format_collapsed(counts: Counter) -> str:
+    """Collapsed stacks, one "stack count" line each (flamegraph.pl / speedscope input)"""
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+def format_stats(counts: Counter, limit: int = 50) -> str:
+    """
+    pstats-like table of sampled functions, sorted by cumulative samples
+
+    :param counts: Counter of collapsed stacks
+    :param limit: Number of functions listed
+    """
+    total = sum(counts.values()) or 1
+    own: Counter = Counter()
+    cumulative: Counter = Counter()
+    for stack, count in counts.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for function in set(frames):
+            cumulative[function] += count
+
+    lines = [f"{total} samples",
+             f"{'own':>8} {'own%':>7} {'cum':>8} {'cum%':>7}  function"]
+    for function, cum in cumulative.most_common(limit):
+        lines.append(f"{own[function]:>8} {own[function] * 100 / total:>6.1f}% "
+                     f"{cum:>8} {cum * 100 / total:>6.1f}%  {function}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,215 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from app.networks import format_ip
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+FLOOD_GUARD_ENABLED = os.getenv("FLOOD_GUARD_ENABLED", "false").lower() == "true"
+# Packets per second from one source to one destination port confirming a flood
+FLOOD_PORT_RATE_THRESHOLD = float(os.getenv("FLOOD_PORT_RATE_THRESHOLD", 200))
+# Packets per second from one source to any port (floods spread over ports)
+FLOOD_SOURCE_RATE_THRESHOLD = float(os.getenv("FLOOD_SOURCE_RATE_THRESHOLD", 1000))
+FLOOD_WINDOW_SECONDS = float(os.getenv("FLOOD_WINDOW_SECONDS", 1.0))
+# How long a confirmed flood is labelled without the model, extended on every confirmation
+FLOOD_HOLD_SECONDS = float(os.getenv("FLOOD_HOLD_SECONDS", 30))
+# Every Nth packet of a held flood still goes through the model
+FLOOD_RESAMPLE_EVERY = int(os.getenv("FLOOD_RESAMPLE_EVERY", 100))
+# Rate trackers kept per table, least recently seen keys are evicted
+FLOOD_MAX_TRACKED = int(os.getenv("FLOOD_MAX_TRACKED", 65536))
+
+# Model classes that can confirm a flood
+FLOOD_CLASSES = {"Dos"}
+
+# Hold keys: (source, destination port) or (source, None) for a whole source
+FloodKey = Tuple[int, Optional[int]]
+
+
+class _RateTable:
+    """
+    Sliding window packet rates per key with bounded memory.
+
+    Each key keeps the counts of the current and the previous window; the rate
+    is the previous window weighted by how much of it still overlaps plus the
+    current one. Keys live in LRU order and the least recently seen is evicted
+    once the table is full.
+    """
+
+    def __init__(self, window: float, capacity: int):
+        self.window = window
+        self.capacity = capacity
+        # key -> [window start, current count, previous count]
+        self._windows: "OrderedDict[Any, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def add(self, key: Any, now: float):
+        """Count a packet for a key"""
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = [now, 0, 0]
+            self._windows[key] = entry
+            if len(self._windows) > self.capacity:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+
+        elapsed = now - entry[0]
+        if elapsed >= self.window:
+            # Skipped windows count as empty
+            entry[2] = entry[1] if elapsed < 2 * self.window else 0
+            entry[1] = 0
+            entry[0] = now - elapsed % self.window
+        entry[1] += 1
+
+    def rate(self, key: Any, now: float) -> float:
+        """Estimated packets per second of a key, 0 if it is not tracked"""
+        entry = self._windows.get(key)
+        return 0.0 if entry is None else self._rate(entry, now)
+
+    def _rate(self, entry: list, now: float) -> float:
+        elapsed = now - entry[0]
+        if elapsed >= 2 * self.window:
+            return 0.0
+        if elapsed >= self.window:
+            return entry[1] * (2 - elapsed / self.window) / self.window
+        return (entry[2] * (1 - elapsed / self.window) + entry[1]) / self.window
+
+
+def _describe(key: FloodKey) -> str:
+    src, dport = key
+    return format_ip(src) if dport is None else f"{format_ip(src)} to port {dport}"
+
+
+class FloodGuard:
+    """
+    Short-circuits inference for confirmed volumetric floods.
+
+    Every inbound packet is counted per (source, destination port) and per
+    source. When the model labels a packet as a flood class while one of its
+    rates is over the threshold, the key is held: further packets of it are
+    labelled with the model's verdict directly for the hold period, except
+    every Nth one which is resampled through the model. A resample that is no
+    longer a flood releases the hold, one that still is extends it.
+    """
+
+    def __init__(self,
+                 port_threshold: float = FLOOD_PORT_RATE_THRESHOLD,
+                 source_threshold: float = FLOOD_SOURCE_RATE_THRESHOLD,
+                 window: float = FLOOD_WINDOW_SECONDS,
+                 hold: float = FLOOD_HOLD_SECONDS,
+                 resample_every: int = FLOOD_RESAMPLE_EVERY,
+                 capacity: int = FLOOD_MAX_TRACKED):
+        self.port_threshold = port_threshold
+        self.source_threshold = source_threshold
+        self.hold = hold
+        self.resample_every = max(1, resample_every)
+
+        self._port_rates = _RateTable(window, capacity)
+        self._source_rates = _RateTable(window, capacity)
+        # key -> [held until, packets since resample, prediction]
+        self._holds: Dict[FloodKey, list] = {}
+
+        self.short_circuited = 0
+        self.resampled = 0
+
+    def _held(self, key: FloodKey, now: float) -> Optional[list]:
+        hold = self._holds.get(key)
+        if hold is not None and hold[0] < now:
+            del self._holds[key]
+            logger.info(f"Flood hold on {_describe(key)} expired")
+            return None
+        return hold
+
+    def _purge_expired(self, now: float):
+        for key in [key for key, hold in self._holds.items() if hold[0] < now]:
+            del self._holds[key]
+
+    def check(self, src: int, dport: int, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Count an inbound packet and label it if its source is a held flood
+
+        :param src: Integer source address
+        :param dport: Destination port
+        :param now: Monotonic time, taken when omitted
+        :return: Prediction for the packet, or None if it must go through the model
+        """
+        now = time.monotonic() if now is None else now
+        self._port_rates.add((src, dport), now)
+        self._source_rates.add(src, now)
+
+        for key in ((src, dport), (src, None)):
+            hold = self._held(key, now)
+            if hold is None:
+                continue
+            hold[1] += 1
+            if hold[1] >= self.resample_every:
+                hold[1] = 0
+                self.resampled += 1
+                break
+            self.short_circuited += 1
+            return hold[2]
+        return None
+
+    def confirm(self, src: int, dport: int, predicted_class: str, confidence: float,
+                now: Optional[float] = None):
+        """
+        Feed back the model's prediction of a packet that check() let through
+
+        :param src: Integer source address
+        :param dport: Destination port
+        :param predicted_class: Predicted class
+        :param confidence: Confidence of the prediction
+        :param now: Monotonic time, taken when omitted
+        """
+        now = time.monotonic() if now is None else now
+        port_rate = self._port_rates.rate((src, dport), now)
+        source_rate = self._source_rates.rate(src, now)
+
+        if predicted_class not in FLOOD_CLASSES:
+            for key in ((src, dport), (src, None)):
+                if self._holds.pop(key, None) is not None:
+                    logger.info(f"Flood hold on {_describe(key)} released, resample is {predicted_class}")
+            return
+
+        if port_rate >= self.port_threshold:
+            key = (src, dport)
+        elif source_rate >= self.source_threshold:
+            key = (src, None)
+        else:
+            return
+
+        prediction = {"predicted_class": predicted_class, "confidence": confidence, "flood_hold": True}
+        hold = self._holds.get(key)
+        if hold is None:
+            self._purge_expired(now)
+            logger.warning(f"Flood confirmed from {_describe(key)} at {max(port_rate, source_rate):.0f} packets/s, "
+                           f"holding for {self.hold:.0f} s")
+            self._holds[key] = [now + self.hold, 0, prediction]
+        else:
+            hold[0] = now + self.hold
+            hold[2] = prediction
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Current guard counters
+
+        :return: Dictionary of held keys, tracked keys and short-circuit counts
+        """
+        return {
+            "held": len(self._holds),
+            "tracked_ports": len(self._port_rates),
+            "tracked_sources": len(self._source_rates),
+            "short_circuited": self.short_circuited,
+            "resampled": self.resampled,
+        }
+
+
+# Global flood guard instance, used from the consumer loop only
+flood_guard = FloodGuard() if FLOOD_GUARD_ENABLED else None
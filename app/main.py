@@ -1,10 +1,15 @@
 from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
-from app.api.routes import routes
-from app.api.websockets import ws
+from app.api.routes import routes, analytics, debug
+from app.api.websockets import ws, stats_stream
 from app.rmq import PikaClient
-from app.mongodb import MongoDBClient
+from app.mongodb import get_mongodb_client, close_mongodb_client
+from app.network_statistics import network_stats_service
+from app.snapshot import snapshotter
+from app.archive import archiver
+from app.models.model import start_inference_pool
+from app.diagnostics import LoopLagMonitor, loop_monitors
 import threading
 import asyncio
 import logging
@@ -51,12 +56,31 @@ def start_background_loop(loop: asyncio.AbstractEventLoop) -> None:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize MongoDB client for API endpoints
+    # "thread" runs the RMQ consumer on its own loop in a daemon thread,
+    # "shared" runs it on the web server loop
+    runtime = os.getenv("CONSUMER_RUNTIME", "thread").lower()
+
+    # WebSocket fan-out always happens on the web server loop
+    ws.manager.start()
+    # Archive writer thread, a no-op unless ARCHIVE_PATH is set
+    archiver.start()
+
+    # Initialize MongoDB client for API endpoints, with the shared runtime
+    # the consumer and statistics use this same client
     logger.info("Initializing MongoDB client")
-    app.mongodb = MongoDBClient()
+    app.mongodb = get_mongodb_client()
+    await app.mongodb.ensure_indexes()
+
+    # Warm restart: restore in-memory state before any traffic is consumed
+    snapshotter.register("network_statistics", network_stats_service)
+    snapshotter.restore()
+
+    # Inference workers load the model now rather than on the first batch,
+    # which would block the consumer loop
+    await asyncio.to_thread(start_inference_pool)
 
     # Initialize RMQ consumer
-    logger.critical("Starting RMQ consumer")
+    logger.critical(f"Starting RMQ consumer ({runtime} runtime)")
     q_name = os.getenv("RMQ_QUEUE_NAME")
     host = os.getenv("RMQ_HOST")
     port = os.getenv("RMQ_PORT")
@@ -64,28 +88,70 @@ async def lifespan(app: FastAPI):
     password = os.getenv("RMQ_PASSWORD")
     app.rmq_consumer = PikaClient(queue_name=q_name, host=host,
                                   port=int(port), user=user, password=password)
-    
-    # Setup RMQ consumer loop
-    app.consumer_loop = asyncio.new_event_loop()
-    tloop = threading.Thread(target=start_background_loop, args=(
-        app.consumer_loop,), daemon=True)
-    tloop.start()
 
-    _ = asyncio.run_coroutine_threadsafe(
-        app.rmq_consumer.start_consumer(), app.consumer_loop)
+    # Event loop lag monitoring
+    loop_monitors.clear()
+    app.monitor_tasks = []
+
+    if runtime == "shared":
+        app.consumer_loop = asyncio.get_running_loop()
+        app.consumer_task = asyncio.create_task(
+            app.rmq_consumer.start_consumer())
+        app.snapshot_task = asyncio.create_task(snapshotter.run())
+
+        loop_monitors["main"] = LoopLagMonitor("main")
+        app.monitor_tasks.append(asyncio.create_task(loop_monitors["main"].run()))
+    else:
+        # Setup RMQ consumer loop
+        app.consumer_loop = asyncio.new_event_loop()
+        tloop = threading.Thread(target=start_background_loop, args=(
+            app.consumer_loop,), name="rmq-consumer", daemon=True)
+        tloop.start()
+
+        _ = asyncio.run_coroutine_threadsafe(
+            app.rmq_consumer.start_consumer(), app.consumer_loop)
+        # Snapshots are taken on the loop that mutates the state
+        app.snapshot_task = asyncio.run_coroutine_threadsafe(
+            snapshotter.run(), app.consumer_loop)
+
+        loop_monitors["uvicorn"] = LoopLagMonitor("uvicorn")
+        loop_monitors["consumer"] = LoopLagMonitor("consumer")
+        app.monitor_tasks.append(asyncio.create_task(loop_monitors["uvicorn"].run()))
+        app.monitor_tasks.append(asyncio.run_coroutine_threadsafe(
+            loop_monitors["consumer"].run(), app.consumer_loop))
 
     yield
-    
-    # Shutdown events
-    await app.rmq_consumer.disconnect()
-    await app.mongodb.close()
-    app.consumer_loop.stop()
+
+    # Shutdown events, a final snapshot is written once consuming stopped
+    app.snapshot_task.cancel()
+    for task in app.monitor_tasks:
+        task.cancel()
+    if runtime == "shared":
+        await app.rmq_consumer.disconnect()
+        await snapshotter.checkpoint()
+    else:
+        # The connection, the state and the consumer's MongoDB client belong
+        # to the consumer loop, handle them there
+        await asyncio.wait_for(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            app.rmq_consumer.disconnect(), app.consumer_loop)), timeout=10)
+        await asyncio.wait_for(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            snapshotter.checkpoint(), app.consumer_loop)), timeout=10)
+        await asyncio.wait_for(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            close_mongodb_client(), app.consumer_loop)), timeout=10)
+    await ws.manager.stop()
+    await asyncio.to_thread(archiver.stop)
+    await close_mongodb_client()
+    if runtime != "shared":
+        app.consumer_loop.call_soon_threadsafe(app.consumer_loop.stop)
 
 
 app = FastAPI(title="Detection Engine Module", debug=True, lifespan=lifespan)
 
 app.include_router(routes.router)
+app.include_router(analytics.router)
 app.include_router(ws.router)
+app.include_router(stats_stream.router)
+app.include_router(debug.router)
 
 
 @app.get("/")
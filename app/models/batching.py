@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+from dotenv import load_dotenv
+
+from app.models.model import predict
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", 256))
+PREDICT_BATCH_MAX_DELAY_MS = float(os.getenv("PREDICT_BATCH_MAX_DELAY_MS", 5))
+PREDICT_BULK_CHUNK_SIZE = int(os.getenv("PREDICT_BULK_CHUNK_SIZE", 512))
+
+
+class PredictionBatcher:
+    """
+    Coalesces concurrent prediction requests into shared model batches.
+
+    Requests are queued on the event loop and a single worker task drains
+    them into one batch until either ``max_batch_size`` rows are collected or
+    ``max_delay`` seconds have passed since the first request of the batch.
+    Inference runs on a dedicated thread so the event loop is never blocked.
+    """
+
+    def __init__(self, max_batch_size: int = PREDICT_BATCH_MAX_SIZE,
+                 max_delay: float = PREDICT_BATCH_MAX_DELAY_MS / 1000):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="predict-batcher")
+
+    def _ensure_worker(self):
+        """Start the batching worker on the running loop if needed"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Score a list of feature dictionaries as part of a shared batch
+
+        :param data_list: Network feature dictionaries
+        :return: Predictions in the same order as the input
+        """
+        if not data_list:
+            return []
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((data_list, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[List[Dict[str, Any]], asyncio.Future]]:
+        """Wait for a request and gather more until the size or deadline is hit"""
+        loop = asyncio.get_running_loop()
+        pending = [await self._queue.get()]
+        rows = len(pending[0][0])
+        deadline = loop.time() + self.max_delay
+
+        while rows < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            pending.append(item)
+            rows += len(item[0])
+
+        return pending
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect()
+            combined = [row for data, _ in pending for row in data]
+
+            try:
+                predictions = await loop.run_in_executor(self._executor, predict, combined)
+            except Exception as e:
+                if len(pending) == 1:
+                    _set_exception(pending[0][1], e)
+                    continue
+                # Score requests one by one so a bad request only fails itself
+                logger.error(f"Batched prediction failed, retrying per request: {e}")
+                for data, future in pending:
+                    try:
+                        result = await loop.run_in_executor(self._executor, predict, data)
+                        _set_result(future, result)
+                    except Exception as request_error:
+                        _set_exception(future, request_error)
+                continue
+
+            offset = 0
+            for data, future in pending:
+                _set_result(future, predictions[offset:offset + len(data)])
+                offset += len(data)
+
+
+def _set_result(future: asyncio.Future, result: Any):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exception: Exception):
+    if not future.done():
+        future.set_exception(exception)
+
+
+# Bulk scoring runs on its own thread so offline jobs queue behind each other,
+# not behind (or in front of) the interactive /predict batches
+_bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict-bulk")
+
+
+async def predict_ndjson_stream(lines: AsyncIterator[bytes],
+                                chunk_size: int = PREDICT_BULK_CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    Score an NDJSON byte stream in chunks and yield NDJSON predictions
+
+    Every non-empty input line produces exactly one output line, either the
+    prediction or an ``{"error": ...}`` object for lines that cannot be parsed.
+
+    :param lines: Request body chunks
+    :param chunk_size: Number of rows scored per model call
+    :return: Async iterator of NDJSON encoded results
+    """
+    loop = asyncio.get_running_loop()
+
+    # Entries are either a row index into ``rows`` or an error message
+    entries: List[Any] = []
+    rows: List[Dict[str, Any]] = []
+    line_number = 0
+
+    async def flush():
+        predictions = []
+        chunk_error = None
+        if rows:
+            try:
+                predictions = await loop.run_in_executor(_bulk_executor, predict, list(rows))
+            except Exception as e:
+                logger.error(f"Bulk prediction chunk failed: {e}")
+                chunk_error = f"chunk failed: {e}"
+        output = []
+        for entry in entries:
+            if isinstance(entry, int):
+                if chunk_error is not None:
+                    output.append(json.dumps({"error": chunk_error}))
+                else:
+                    output.append(json.dumps(predictions[entry]))
+            else:
+                output.append(json.dumps({"error": entry}))
+        entries.clear()
+        rows.clear()
+        return "\n".join(output) + "\n"
+
+    buffer = b""
+    async for chunk in lines:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+                entries.append(len(rows) - 1)
+            except ValueError as e:
+                entries.append(f"line {line_number}: {e}")
+
+            if len(rows) >= chunk_size:
+                yield await flush()
+
+    if buffer.strip():
+        line_number += 1
+        try:
+            rows.append(json.loads(buffer))
+            entries.append(len(rows) - 1)
+        except ValueError as e:
+            entries.append(f"line {line_number}: {e}")
+
+    if entries:
+        yield await flush()
+
+
+# Global batcher instance for the REST API
+prediction_batcher = PredictionBatcher()
@@ -1,40 +1,195 @@
 import numpy as np
 import tensorflow as tf
+import logging
 import os
 import joblib
+from typing import Any, Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
 
 from app.preprocessing.preprocessing import preprocess_data
+from app.models.pool import get_inference_pool
+from app.severity import CLASS_SEVERITY, SEVERITY_NONE
 
-# Multi-Class
-model_path = os.path.join(os.path.dirname(__file__), '../../trained_models/cnn/2505_combined_full/model.h5')
-label_encoder_path = os.path.join(os.path.dirname(__file__), '../../trained_models/cnn/2505_combined_full/label_encoder.pkl')
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# Multi-Class, the bundle directory holds model.h5, label_encoder.pkl and preprocessor.joblib
+MODEL_BUNDLE_PATH = os.getenv(
+    "MODEL_BUNDLE_PATH",
+    os.path.join(os.path.dirname(__file__), '../../trained_models/cnn/2505_combined_full'))
+model_path = os.path.join(MODEL_BUNDLE_PATH, 'model.h5')
+label_encoder_path = os.path.join(MODEL_BUNDLE_PATH, 'label_encoder.pkl')
 model = tf.keras.models.load_model(model_path)
-label_encoder = joblib.load(label_encoder_path) 
+label_encoder = joblib.load(label_encoder_path)
 
+# Non-normal predictions below their class threshold are reported as normal with 0 confidence.
+# CLASS_CONFIDENCE_THRESHOLDS overrides the default per class, e.g. "Probe=0.9,Dos=0.7"
+DEFAULT_CONFIDENCE_THRESHOLD = float(os.getenv("DEFAULT_CONFIDENCE_THRESHOLD", 0.75))
 
-def predict(data_list):
+
+def _parse_class_thresholds(value: str) -> Dict[str, float]:
+    """
+    Parse "Class=threshold" pairs, malformed entries are logged and skipped
+
+    :param value: Comma separated pairs, e.g. "Probe=0.9,Dos=0.7"
+    :return: Threshold per class name
+    """
+    thresholds = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, threshold = item.partition("=")
+        try:
+            threshold = float(threshold)
+        except ValueError:
+            threshold = None
+        if not name.strip() or threshold is None or not 0.0 <= threshold <= 1.0:
+            logger.error(f"Ignoring malformed CLASS_CONFIDENCE_THRESHOLDS entry '{item.strip()}'")
+            continue
+        thresholds[name.strip()] = threshold
+    return thresholds
+
+
+CLASS_CONFIDENCE_THRESHOLDS = _parse_class_thresholds(os.getenv("CLASS_CONFIDENCE_THRESHOLDS", ""))
+
+# Lookup tables by class index, built once for the loaded label encoder
+class_labels = np.asarray(label_encoder.classes_)
+NORMAL_INDEX = int(np.flatnonzero(class_labels == 'normal')[0])
+for unknown_class in sorted(set(CLASS_CONFIDENCE_THRESHOLDS) - set(class_labels.tolist())):
+    logger.warning(f"CLASS_CONFIDENCE_THRESHOLDS names '{unknown_class}', which the model does not predict")
+class_thresholds = np.array([
+    0.0 if label == 'normal' else CLASS_CONFIDENCE_THRESHOLDS.get(label, DEFAULT_CONFIDENCE_THRESHOLD)
+    for label in class_labels
+], dtype=np.float32)
+class_severities = np.array([CLASS_SEVERITY.get(label, SEVERITY_NONE) for label in class_labels], dtype=np.int8)
+
+# Static batch sizes inference is padded to, each one gets its own compiled graph.
+# Batches larger than the biggest bucket are split into chunks of that size.
+INFERENCE_BUCKETS = sorted(int(size) for size in os.getenv("INFERENCE_BUCKETS", "1,8,32,128,512").split(","))
+INFERENCE_JIT_COMPILE = os.getenv("INFERENCE_JIT_COMPILE", "true").lower() == "true"
+
+# Per-row input shape, (1, features) for CNN and RNN, (features,) for DNN
+feature_shape = tuple(model.input_shape[1:])
+
+
+@tf.function(jit_compile=INFERENCE_JIT_COMPILE)
+def _serve(features):
+    return model(features, training=False)
+
+
+# One concrete function per bucket, traced and warmed up at load time
+_bucket_functions = {
+    size: _serve.get_concrete_function(tf.TensorSpec((size,) + feature_shape, tf.float32))
+    for size in INFERENCE_BUCKETS
+}
+for _size, _function in _bucket_functions.items():
+    _function(tf.zeros((_size,) + feature_shape, tf.float32))
+
+
+def infer(processed_features):
+    """
+    Run the model on preprocessed features using the bucketed static-batch graphs
+
+    :param processed_features: 2D array of preprocessed features
+    :return: 2D array of class probabilities, one row per input row
+    """
+    count = processed_features.shape[0]
+    features = np.asarray(processed_features, dtype=np.float32).reshape((count,) + feature_shape)
+
+    if count == 0:
+        return np.zeros((0,) + tuple(model.output_shape[1:]), dtype=np.float32)
+
+    largest = INFERENCE_BUCKETS[-1]
+    outputs = []
+    for start in range(0, count, largest):
+        chunk = features[start:start + largest]
+        size = chunk.shape[0]
+        bucket = next(b for b in INFERENCE_BUCKETS if b >= size)
+        if bucket != size:
+            padded = np.zeros((bucket,) + feature_shape, dtype=np.float32)
+            padded[:size] = chunk
+            chunk = padded
+        # Strip the padding rows from the output
+        outputs.append(_bucket_functions[bucket](tf.constant(chunk)).numpy()[:size])
+
+    if len(outputs) == 1:
+        return outputs[0]
+    return np.concatenate(outputs)
+
+
+def start_inference_pool():
+    """
+    Start the inference pool, when one is configured, and wait until every
+    worker has loaded the model. Blocks, so call it off the event loop.
+    """
+    get_inference_pool(int(np.prod(feature_shape)), model.output_shape[-1])
+
+
+def run_inference(processed_features):
+    """
+    Score preprocessed features on the inference pool when one is configured,
+    otherwise in this process
+
+    :param processed_features: 2D array of preprocessed features
+    :return: 2D array of class probabilities
+    """
+    pool = get_inference_pool(int(np.prod(feature_shape)), model.output_shape[-1])
+    if pool is not None:
+        return pool.run(processed_features)
+    return infer(processed_features)
+
+
+class PredictionColumns(NamedTuple):
+    """Columnar predictions, one entry per input row"""
+    class_index: np.ndarray  # index into class_labels
+    confidence: np.ndarray   # float32, 0 for predictions below their threshold
+    severity: np.ndarray     # SEVERITY_* level of the class
+
+    def labels(self) -> np.ndarray:
+        """Class label of every row"""
+        return class_labels[self.class_index]
+
+    def to_dicts(self, rows: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Per-row prediction dictionaries, only built for rows leaving the process
+
+        :param rows: Row positions, all rows when omitted
+        :return: List of {"predicted_class", "confidence"} dictionaries
+        """
+        class_index = self.class_index if rows is None else self.class_index[rows]
+        confidence = self.confidence if rows is None else self.confidence[rows]
+        return [
+            {'predicted_class': label, 'confidence': value}
+            for label, value in zip(class_labels[class_index].tolist(), confidence.tolist())
+        ]
+
+
+def predict_columnar(data_list) -> PredictionColumns:
+    """
+    Preprocess, score and threshold a batch, without per-row Python work
+
+    :param data_list: List of feature dictionaries or a feature DataFrame
+    :return: PredictionColumns of class indices, confidences and severities
+    """
     processed_features = preprocess_data(data_list)
-    # For CNN and RNN
-    processed_features_rnncnn = processed_features.reshape(processed_features.shape[0], 1, processed_features.shape[1])
-    predictions = model.predict(processed_features_rnncnn)
-    # predictions = model.predict(processed_features)
-    predicted_class_indices = np.argmax(predictions, axis=1)
-    confidences = np.max(predictions, axis=1)
-    
-    predicted_class_labels = label_encoder.inverse_transform(predicted_class_indices).tolist()
-    
-    results = []
-    confidence_threshold = 0.75
-    for label, confidence in zip(predicted_class_labels, confidences):
-        if float(confidence) < confidence_threshold and label != 'normal':
-            results.append({
-                'predicted_class': 'normal',
-                'confidence': float(0)
-            })
-        else:
-            results.append({
-                'predicted_class': label,
-                'confidence': float(confidence)
-            })
-    
-    return results
\ No newline at end of file
+    predictions = run_inference(processed_features)
+
+    class_index = np.argmax(predictions, axis=1)
+    confidence = predictions[np.arange(len(class_index)), class_index].astype(np.float32)
+
+    below = confidence < class_thresholds[class_index]
+    class_index[below] = NORMAL_INDEX
+    confidence[below] = 0.0
+
+    return PredictionColumns(class_index, confidence, class_severities[class_index])
+
+
+def predict(data_list):
+    """
+    Predictions as one dictionary per row
+
+    :param data_list: List of feature dictionaries or a feature DataFrame
+    :return: List of {"predicted_class", "confidence"} dictionaries
+    """
+    return predict_columnar(data_list).to_dicts()
@@ -0,0 +1,249 @@
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional
+import atexit
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# Number of inference worker processes, 0 keeps inference in-process
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))
+# Rows each worker's shared memory buffers can hold per call
+INFERENCE_WORKER_MAX_ROWS = int(os.getenv("INFERENCE_WORKER_MAX_ROWS", 1024))
+# TensorFlow intra-op threads per worker, keeps workers from oversubscribing cores
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", 1))
+# "least_loaded" or "round_robin"
+INFERENCE_DISPATCH = os.getenv("INFERENCE_DISPATCH", "least_loaded")
+# Seconds to wait for a worker to answer before it is considered hung
+INFERENCE_WORKER_TIMEOUT = float(os.getenv("INFERENCE_WORKER_TIMEOUT", 30))
+
+
+def _worker_main(conn, input_name: str, output_name: str, max_rows: int,
+                 feature_count: int, class_count: int, threads: int):
+    """
+    Inference worker process: loads the model once, then scores the rows the
+    parent writes into its input buffer and writes probabilities back.
+    """
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    from app.models.model import infer
+
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    inputs = np.ndarray((max_rows, feature_count), dtype=np.float32, buffer=input_shm.buf)
+    outputs = np.ndarray((max_rows, class_count), dtype=np.float32, buffer=output_shm.buf)
+
+    conn.send(("ready", None))
+    try:
+        while True:
+            rows = conn.recv()
+            if rows is None:
+                break
+            try:
+                outputs[:rows] = infer(inputs[:rows])
+                conn.send(("ok", rows))
+            except Exception as e:
+                conn.send(("error", repr(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        input_shm.close()
+        output_shm.close()
+
+
+class _WorkerSlot:
+    """A worker process together with its pipe and shared memory buffers"""
+
+    def __init__(self, index: int, max_rows: int, feature_count: int, class_count: int):
+        self.index = index
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.process = None
+        self.conn = None
+
+        self.input_shm = shared_memory.SharedMemory(
+            create=True, size=max_rows * feature_count * 4)
+        self.output_shm = shared_memory.SharedMemory(
+            create=True, size=max_rows * class_count * 4)
+        self.inputs = np.ndarray((max_rows, feature_count), dtype=np.float32,
+                                 buffer=self.input_shm.buf)
+        self.outputs = np.ndarray((max_rows, class_count), dtype=np.float32,
+                                  buffer=self.output_shm.buf)
+
+
+class InferencePool:
+    """
+    Pool of inference worker processes fed through shared memory.
+
+    Each worker owns an input buffer (preprocessed features) and an output
+    buffer (class probabilities). Only the row count travels over the pipe, so
+    batches are never pickled. Large batches are split across workers, crashed
+    or hung workers are restarted.
+    """
+
+    def __init__(self, workers: int, feature_count: int, class_count: int,
+                 max_rows: int = INFERENCE_WORKER_MAX_ROWS,
+                 dispatch: str = INFERENCE_DISPATCH,
+                 threads: int = INFERENCE_WORKER_THREADS,
+                 timeout: float = INFERENCE_WORKER_TIMEOUT):
+        if dispatch not in ("least_loaded", "round_robin"):
+            raise ValueError(f"Unknown inference dispatch policy: {dispatch}")
+
+        self.feature_count = feature_count
+        self.class_count = class_count
+        self.max_rows = max_rows
+        self.dispatch = dispatch
+        self.threads = threads
+        self.timeout = timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._select_lock = threading.Lock()
+        self._round_robin = itertools.cycle(range(workers))
+        self._slots: List[_WorkerSlot] = []
+        for index in range(workers):
+            slot = _WorkerSlot(index, max_rows, feature_count, class_count)
+            self._slots.append(slot)
+            self._start_worker(slot)
+
+        # Chunks of one call are handed to several workers concurrently
+        self._dispatcher = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="inference-dispatch")
+        logger.info(f"Inference pool started with {workers} workers ({dispatch})")
+
+    def _start_worker(self, slot: _WorkerSlot):
+        parent_conn, child_conn = self._context.Pipe()
+        slot.process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, slot.input_shm.name, slot.output_shm.name, self.max_rows,
+                  self.feature_count, self.class_count, self.threads),
+            name=f"inference-worker-{slot.index}",
+            daemon=True
+        )
+        slot.process.start()
+        child_conn.close()
+        slot.conn = parent_conn
+
+        # Model loading can take a while, it is not bound by the call timeout
+        try:
+            status, _ = slot.conn.recv()
+        except EOFError:
+            status = None
+        if status != "ready":
+            raise RuntimeError(f"Inference worker {slot.index} failed to start")
+
+    def _restart_worker(self, slot: _WorkerSlot):
+        logger.error(f"Restarting inference worker {slot.index}")
+        try:
+            if slot.process.is_alive():
+                slot.process.terminate()
+            slot.process.join(timeout=5)
+            slot.conn.close()
+        except Exception as e:
+            logger.error(f"Error stopping inference worker {slot.index}: {e}")
+        self._start_worker(slot)
+
+    def _select_slot(self) -> _WorkerSlot:
+        with self._select_lock:
+            if self.dispatch == "round_robin":
+                slot = self._slots[next(self._round_robin)]
+            else:
+                slot = min(self._slots, key=lambda s: s.in_flight)
+            slot.in_flight += 1
+            return slot
+
+    def _run_chunk(self, chunk: np.ndarray) -> np.ndarray:
+        slot = self._select_slot()
+        rows = chunk.shape[0]
+        try:
+            with slot.lock:
+                if not slot.process.is_alive():
+                    self._restart_worker(slot)
+
+                slot.inputs[:rows] = chunk
+                try:
+                    slot.conn.send(rows)
+                    if not slot.conn.poll(self.timeout):
+                        raise TimeoutError(f"inference worker {slot.index} timed out")
+                    status, detail = slot.conn.recv()
+                except (EOFError, OSError, TimeoutError) as e:
+                    self._restart_worker(slot)
+                    raise RuntimeError(f"Inference worker {slot.index} failed: {e!r}")
+
+                if status != "ok":
+                    raise RuntimeError(f"Inference worker {slot.index} error: {detail}")
+                return slot.outputs[:rows].copy()
+        finally:
+            with self._select_lock:
+                slot.in_flight -= 1
+
+    def run(self, processed_features: np.ndarray) -> np.ndarray:
+        """
+        Score preprocessed features on the worker processes
+
+        :param processed_features: 2D array of preprocessed features
+        :return: 2D array of class probabilities, one row per input row
+        """
+        features = np.asarray(processed_features, dtype=np.float32)
+        count = features.shape[0]
+        if count == 0:
+            return np.zeros((0, self.class_count), dtype=np.float32)
+
+        # Spread the rows evenly over the workers, bounded by the buffer size
+        chunk_rows = min(self.max_rows, math.ceil(count / len(self._slots)))
+        chunks = [features[start:start + chunk_rows]
+                  for start in range(0, count, chunk_rows)]
+        if len(chunks) == 1:
+            return self._run_chunk(chunks[0])
+        return np.concatenate(list(self._dispatcher.map(self._run_chunk, chunks)))
+
+    def close(self):
+        """Stop the workers and release the shared memory buffers"""
+        self._dispatcher.shutdown(wait=False)
+        for slot in self._slots:
+            try:
+                slot.conn.send(None)
+                slot.process.join(timeout=5)
+                if slot.process.is_alive():
+                    slot.process.terminate()
+                slot.conn.close()
+            except Exception as e:
+                logger.error(f"Error stopping inference worker {slot.index}: {e}")
+            del slot.inputs, slot.outputs
+            slot.input_shm.close()
+            slot.input_shm.unlink()
+            slot.output_shm.close()
+            slot.output_shm.unlink()
+        self._slots = []
+        logger.info("Inference pool stopped")
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool(feature_count: int, class_count: int) -> Optional[InferencePool]:
+    """
+    Get the process wide inference pool, started on first use
+
+    :return: The pool, or None when INFERENCE_WORKERS is 0
+    """
+    global _pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(INFERENCE_WORKERS, feature_count, class_count)
+                atexit.register(_pool.close)
+    return _pool
@@ -1,16 +1,67 @@
 import os
 import asyncio
-from pymongo import AsyncMongoClient
-from typing import Dict, Any, List
+import threading
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, UpdateOne
+from pymongo.write_concern import WriteConcern
+from typing import Dict, Any, List, Optional
 import logging
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import time
+from app.networks import ip_bytes, ip_from_bytes, ip_from_key, format_ip, INVALID_IP
 
 load_dotenv()
 
 logger = logging.getLogger("myapp")
 
+# Statistics history granularities, finest first: (name, bucket size in seconds)
+STATS_HISTORY_ROLLUPS = [("minute", 60), ("hour", 3600), ("day", 86400)]
+
+# How long each granularity is kept before the TTL monitor removes it (None = forever)
+STATS_HISTORY_RETENTION = {
+    "minute": int(os.getenv("STATS_MINUTE_RETENTION_HOURS", 48)) * 3600,
+    "hour": int(os.getenv("STATS_HOUR_RETENTION_DAYS", 90)) * 86400,
+    "day": None,
+}
+
+# Counters written into the history buckets. Per-IP/port maps are left out
+# on purpose, they would make every bucket as large as the cumulative document.
+STATS_HISTORY_COUNTERS = ["pkt_in", "pkt_out",
+                          "low_count", "med_count", "high_count"]
+STATS_HISTORY_DISTRIBUTIONS = ["protocols_count",
+                               "services_count", "attack_type_count"]
+
+# Keyed counters, one document per (dimension, key) in the counters collection.
+# Keys are stored as packed addresses (IP dimensions), integers (ports) or strings.
+STATS_IP_DIMENSIONS = ["top_talkers", "top_attackers"]
+STATS_PORT_DIMENSIONS = ["top_ports", "top_attacked_ports"]
+STATS_DIMENSIONS = STATS_HISTORY_DISTRIBUTIONS + STATS_IP_DIMENSIONS + STATS_PORT_DIMENSIONS
+
+# Entries returned per top-N dimension; distributions are small and returned whole
+STATS_TOP_N = int(os.getenv("STATS_TOP_N", 10))
+
+
+def _write_concern(w: str, journal: str) -> WriteConcern:
+    """Build a write concern from its environment representation"""
+    w = int(w) if w.isdigit() else w
+    if w == 0:
+        # Unacknowledged writes cannot ask for journaling
+        return WriteConcern(w=0)
+    return WriteConcern(w=w, j=journal.lower() == "true")
+
+
+# Named write profiles, picked per collection by workload:
+# - telemetry: high rate statistics deltas, losing one on a crash is acceptable
+# - alerts: detections, must survive a primary failure
+# - default: driver default (acknowledged)
+WRITE_PROFILES = {
+    "telemetry": _write_concern(os.getenv("MONGO_TELEMETRY_W", "1"),
+                                os.getenv("MONGO_TELEMETRY_JOURNAL", "false")),
+    "alerts": _write_concern(os.getenv("MONGO_ALERTS_W", "majority"),
+                             os.getenv("MONGO_ALERTS_JOURNAL", "true")),
+    "default": WriteConcern(),
+}
+
 
 class MongoDBClient:
     def __init__(self):
@@ -26,18 +77,129 @@ class MongoDBClient:
             # Construct connection string
             connection_string = f"mongodb://{mongo_user}:{mongo_password}@{mongo_host}:{mongo_port}"
 
-            self.client = AsyncMongoClient(connection_string)
+            # Pool, timeout and compression settings
+            client_options = {
+                "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+                "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+                "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+                "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+                "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000)),
+            }
+            compressors = os.getenv("MONGO_COMPRESSORS", "zlib")
+            if compressors:
+                client_options["compressors"] = compressors
+
+            self.client = AsyncMongoClient(connection_string, **client_options)
             self.db = self.client[mongo_db]
 
             # Define collections
-            self.non_normal_packets_collection = self.db["non_normal_packets"]
-            self.network_statistics_collection = self.db["network_statistics"]
+            self.non_normal_packets_collection = self.collection("non_normal_packets", "alerts")
+            self.network_statistics_collection = self.collection("network_statistics", "telemetry")
+            self.network_statistics_counters_collection = self.collection(
+                "network_statistics_counters", "telemetry")
+            self.network_statistics_history_collections = {
+                name: self.collection(f"network_statistics_{name}", "telemetry")
+                for name, _ in STATS_HISTORY_ROLLUPS
+            }
 
             logger.info("MongoDB connection initialized successfully")
         except Exception as e:
             logger.error(f"MongoDB connection error: {e}")
             raise
 
+    def collection(self, name: str, profile: str = "default"):
+        """
+        Get a collection handle using one of the named write profiles
+
+        :param name: Collection name
+        :param profile: Key of WRITE_PROFILES
+        :return: Collection with the profile's write concern
+        """
+        return self.db.get_collection(name, write_concern=WRITE_PROFILES[profile])
+
+    async def ensure_indexes(self):
+        """
+        Create the indexes the collections rely on.
+        Fine and medium grained statistics buckets expire through TTL indexes,
+        keyed counters are unique per (dimension, key) and sorted by count.
+        """
+        try:
+            # Index builds always use the default (acknowledged) write concern
+            alerts = self.db[self.non_normal_packets_collection.name]
+            # Time range scans grouped by class, and per-target breakdowns
+            await alerts.create_index([("timestamp", ASCENDING), ("predicted_class", ASCENDING)])
+            await alerts.create_index([("ipdst", ASCENDING), ("timestamp", ASCENDING)])
+            # Recent alert drill-down past the in-memory store
+            await alerts.create_index([("ipsrc", ASCENDING), ("timestamp", ASCENDING)])
+            await alerts.create_index([("dport", ASCENDING), ("timestamp", ASCENDING)])
+
+            counters = self.db[self.network_statistics_counters_collection.name]
+            await counters.create_index([("dimension", ASCENDING), ("key", ASCENDING)], unique=True)
+            await counters.create_index([("dimension", ASCENDING), ("count", DESCENDING)])
+
+            for name, collection in self.network_statistics_history_collections.items():
+                retention = STATS_HISTORY_RETENTION[name]
+                if retention is not None:
+                    await self._ensure_ttl_index(self.db[collection.name], "bucket", retention)
+            logger.info("MongoDB indexes ensured")
+        except Exception as e:
+            logger.error(f"Error creating MongoDB indexes: {e}")
+
+        try:
+            await self._migrate_cumulative_maps()
+        except Exception as e:
+            logger.error(f"Error migrating cumulative statistics counters: {e}")
+
+    async def _ensure_ttl_index(self, collection, field: str, expire_after: int):
+        """
+        Create a TTL index on a field, or update the expiry of an existing one
+        (create_index refuses to change the options of an index)
+
+        :param collection: Collection handle
+        :param field: Indexed date field
+        :param expire_after: Expiry in seconds
+        """
+        for index in (await collection.index_information()).values():
+            if index["key"] == [(field, ASCENDING)]:
+                if index.get("expireAfterSeconds") != expire_after:
+                    await self.db.command("collMod", collection.name, index={
+                        "keyPattern": {field: ASCENDING}, "expireAfterSeconds": expire_after})
+                    logger.info(f"Updated {collection.name} retention to {expire_after} s")
+                return
+        await collection.create_index(field, expireAfterSeconds=expire_after)
+
+    async def _migrate_cumulative_maps(self):
+        """
+        Move keyed counters still nested in an older cumulative statistics
+        document into the counters collection
+        """
+        document_id = "cumulative_network_stats"
+        projection = {field: 1 for field in STATS_DIMENSIONS}
+        existing_doc = await self.network_statistics_collection.find_one({"_id": document_id}, projection)
+        if not existing_doc or len(existing_doc) == 1:
+            return
+
+        legacy = {}
+        for field in STATS_DIMENSIONS:
+            values = {}
+            for key, value in existing_doc.get(field, {}).items():
+                # Hex and older dashed IP keys of one address are merged
+                if field in STATS_IP_DIMENSIONS:
+                    key = ip_from_key(key)
+                    if key == INVALID_IP:
+                        continue
+                elif field in STATS_PORT_DIMENSIONS:
+                    if not key.isdigit():
+                        continue
+                    key = int(key)
+                values[key] = values.get(key, 0) + value
+            legacy[field] = values
+
+        await self._increment_counters(legacy)
+        await self.network_statistics_collection.update_one(
+            {"_id": document_id}, {"$unset": {field: "" for field in STATS_DIMENSIONS}})
+        logger.info("Migrated cumulative statistics maps to the counters collection")
+
     async def insert_non_normal_packets(self, packet: Dict[str, Any]):
         """
         Insert non-normal packets into MongoDB
@@ -50,12 +212,15 @@ class MongoDBClient:
 
     async def batch_insert_non_normal_packets(self, packets: List[Dict[str, Any]]):
         """
-        Insert non-normal packets into MongoDB in batch
+        Insert non-normal packets into MongoDB in batch, one round trip under
+        the alerts write profile. Unordered, so one failing document does not
+        stop the others.
 
-        :param packets: non-normal packet dictionaries
+        :param packets: non-normal packet dictionaries, not modified
         :return: Result of the insert operation
         """
-        result = await self.non_normal_packets_collection.insert_many(packets.copy())
+        result = await self.non_normal_packets_collection.insert_many(
+            [packet.copy() for packet in packets], ordered=False)
         return result
 
     async def update_network_statistics(self, statistics: Dict[str, Any]):
@@ -66,60 +231,158 @@ class MongoDBClient:
         :return: Result of the update operation
         """
         try:
-            # Use a fixed document ID for cumulative statistics
+            # Scalars stay in one small fixed document
             document_id = "cumulative_network_stats"
-            # First get existing document to properly merge dictionaries
-            existing_doc = await self.network_statistics_collection.find_one({"_id": document_id})
-
-            # Create base update document with simple increments
             update_doc = {
                 "$set": {"last_updated": datetime.now()},
-                "$inc": {
-                    "pkt_in": statistics.get("pkt_in", 0),
-                    "pkt_out": statistics.get("pkt_out", 0),
-                    "low_count": statistics.get("low_count", 0),
-                    "med_count": statistics.get("med_count", 0),
-                    "high_count": statistics.get("high_count", 0)
-                }
+                "$inc": {field: statistics.get(field, 0) for field in STATS_HISTORY_COUNTERS}
             }
-
-            # Handle dictionary fields that need accumulation
-            for stat_field in ["protocols_count", "services_count", "attack_type_count",
-                               "top_talkers", "top_ports", "top_attacked_ports", "top_attackers"]:
-                new_values = statistics.get(stat_field, {})
-                if new_values:
-                    existing_values = existing_doc.get(
-                        stat_field, {}) if existing_doc else {}
-
-                    # Merge and accumulate values
-                    for key, value in new_values.items():
-                        # For IP addresses (in top_talkers and top_attackers), replace dots with (- dash)
-                        # Mongodb does not allow dots in keys
-                        if stat_field in ["top_talkers", "top_attackers"]:
-                            key = key.replace(".", "-")
-
-                        inc_path = f"{stat_field}.{key}"
-                        if inc_path not in update_doc["$inc"]:
-                            update_doc["$inc"][inc_path] = 0
-                        update_doc["$inc"][inc_path] += value
-
-            # Perform an upsert operation
             result = await self.network_statistics_collection.update_one(
                 {"_id": document_id},
                 update_doc,
                 upsert=True
             )
 
+            await self._increment_counters(statistics)
+            await self._update_network_statistics_history(statistics)
+
             logger.info("Updated cumulative network statistics")
             return result
         except Exception as e:
             logger.error(f"Error updating network statistics: {e}")
             return None
 
+    async def _increment_counters(self, statistics: Dict[str, Any]):
+        """
+        Add the keyed counters of a statistics delta to the counters collection
+        with one unordered bulk of upserts
+
+        :param statistics: Dictionary of network statistics since the last flush
+        """
+        operations = []
+        for dimension in STATS_DIMENSIONS:
+            for key, value in statistics.get(dimension, {}).items():
+                if not value:
+                    continue
+                # IP addresses are integers in memory, stored packed
+                if dimension in STATS_IP_DIMENSIONS:
+                    key = ip_bytes(key)
+                operations.append(UpdateOne(
+                    {"dimension": dimension, "key": key},
+                    {"$inc": {"count": value}},
+                    upsert=True
+                ))
+
+        if operations:
+            await self.network_statistics_counters_collection.bulk_write(operations, ordered=False)
+
+    async def _get_counters(self, dimension: str, limit: int = 0) -> Dict[str, int]:
+        """
+        Counters of one dimension by descending count, served by the
+        (dimension, count) index
+
+        :param dimension: One of STATS_DIMENSIONS
+        :param limit: Number of entries, all when 0
+        :return: Dictionary of key to count, IP addresses formatted
+        """
+        cursor = self.network_statistics_counters_collection.find(
+            {"dimension": dimension}, {"_id": 0, "key": 1, "count": 1}
+        ).sort("count", DESCENDING).limit(limit)
+
+        counters = {}
+        async for doc in cursor:
+            key = doc["key"]
+            if dimension in STATS_IP_DIMENSIONS:
+                key = format_ip(ip_from_bytes(key))
+            counters[str(key)] = doc["count"]
+        return counters
+
+    async def _update_network_statistics_history(self, statistics: Dict[str, Any]):
+        """
+        Add a statistics delta to the current minute, hour and day buckets
+
+        :param statistics: Dictionary of network statistics since the last flush
+        """
+        inc_doc = {}
+        for field in STATS_HISTORY_COUNTERS:
+            value = statistics.get(field, 0)
+            if value:
+                inc_doc[field] = value
+        for field in STATS_HISTORY_DISTRIBUTIONS:
+            for key, value in statistics.get(field, {}).items():
+                inc_doc[f"{field}.{key}"] = value
+
+        if not inc_doc:
+            return
+
+        now = time.time()
+        for name, seconds in STATS_HISTORY_ROLLUPS:
+            bucket = _bucket_start(now, seconds)
+            await self.network_statistics_history_collections[name].update_one(
+                {"_id": bucket},
+                {"$inc": inc_doc, "$setOnInsert": {"bucket": bucket}},
+                upsert=True
+            )
+
+    async def get_network_statistics_history(self, start: float, end: float, step: int):
+        """
+        Retrieve network statistics aggregated into fixed steps over a time range.
+        The coarsest rollup that still resolves the step and covers the range is used.
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param step: Requested step size in seconds
+        :return: Dictionary with the rollup used, the effective step and the buckets
+        """
+        rollup, rollup_seconds = _select_rollup(start, step)
+        # Steps can only be multiples of the rollup bucket size
+        step = max(rollup_seconds, step - step % rollup_seconds)
+
+        try:
+            cursor = self.network_statistics_history_collections[rollup].find({
+                "_id": {
+                    "$gte": _bucket_start(start, rollup_seconds),
+                    "$lt": datetime.fromtimestamp(end, tz=timezone.utc)
+                }
+            }).sort("_id", 1)
+
+            windows: Dict[int, Dict[str, Any]] = {}
+            async for doc in cursor:
+                bucket_ts = int(doc["_id"].replace(tzinfo=timezone.utc).timestamp())
+                window_ts = bucket_ts - bucket_ts % step
+                window = windows.get(window_ts)
+                if window is None:
+                    window = {"timestamp": window_ts}
+                    for field in STATS_HISTORY_COUNTERS:
+                        window[field] = 0
+                    for field in STATS_HISTORY_DISTRIBUTIONS:
+                        window[field] = {}
+                    windows[window_ts] = window
+
+                for field in STATS_HISTORY_COUNTERS:
+                    window[field] += doc.get(field, 0)
+                for field in STATS_HISTORY_DISTRIBUTIONS:
+                    merged = window[field]
+                    for key, value in doc.get(field, {}).items():
+                        merged[key] = merged.get(key, 0) + value
+
+            logger.info(
+                f"Retrieved {len(windows)} statistics buckets from the {rollup} rollup")
+            return {
+                "rollup": rollup,
+                "step": step,
+                "from": start,
+                "to": end,
+                "buckets": list(windows.values())
+            }
+        except Exception as e:
+            logger.error(f"Error retrieving network statistics history: {e}")
+            return {"rollup": rollup, "step": step, "from": start, "to": end, "buckets": []}
+
     async def close(self):
         """Close MongoDB connection"""
         try:
-            self.client.close()
+            await self.client.close()
             logger.info("MongoDB connection closed")
         except Exception as e:
             logger.error(f"Error closing MongoDB connection: {e}")
@@ -158,6 +421,131 @@ class MongoDBClient:
             logger.error(f"Error retrieving non-normal packets: {e}")
             return []
 
+    async def get_alerts(self, start: float, end: float, filters: Optional[Dict[str, Any]] = None,
+                         limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Stored alerts matching field filters, newest first
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param filters: Field equality filters, e.g. ipsrc, dport, predicted_class
+        :param limit: Page size
+        :param offset: Matching alerts skipped
+        :return: Page of alerts without _id
+        """
+        query = {"timestamp": {"$gte": start, "$lt": end}}
+        for field, value in (filters or {}).items():
+            if value is not None:
+                query[field] = value
+        # Ports are stored as sent, numbers or strings
+        dport = query.get("dport")
+        if dport is not None and str(dport).isdigit():
+            query["dport"] = {"$in": [int(dport), str(int(dport))]}
+        cursor = self.non_normal_packets_collection.find(query, {"_id": 0}) \
+            .sort("timestamp", DESCENDING).skip(offset).limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def get_alerts_timeline(self, start: float, end: float, step: int) -> List[Dict[str, Any]]:
+        """
+        Count stored alerts per class per time bucket
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param step: Bucket size in seconds
+        :return: Buckets in time order with the total and the count per class
+        """
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {
+                    "bucket": {"$subtract": ["$timestamp", {"$mod": ["$timestamp", step]}]},
+                    "class": "$predicted_class"
+                },
+                "count": {"$sum": 1}
+            }},
+            {"$group": {
+                "_id": "$_id.bucket",
+                "total": {"$sum": "$count"},
+                "classes": {"$push": {"k": "$_id.class", "v": "$count"}}
+            }},
+            {"$project": {"_id": 0, "timestamp": "$_id", "total": 1,
+                          "classes": {"$arrayToObject": "$classes"}}},
+            {"$sort": {"timestamp": 1}}
+        ]
+        cursor = await self.non_normal_packets_collection.aggregate(pipeline)
+        return await cursor.to_list(length=None)
+
+    async def get_alerts_top(self, start: float, end: float, field: str, limit: int = 10,
+                             ipdst: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Most frequent values of a field among stored alerts
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param field: Alert field to group by, e.g. ipsrc or dport
+        :param limit: Number of values returned
+        :param ipdst: Only count alerts against this target
+        :return: Values by descending count with their classes and last occurrence
+        """
+        match = {"timestamp": {"$gte": start, "$lt": end}}
+        if ipdst is not None:
+            match["ipdst"] = ipdst
+        group_key: Any = f"${field}"
+        if field in ("dport", "sport"):
+            # Ports are stored as sent, 22 and "22" must share one bucket
+            group_key = {"$convert": {"input": group_key, "to": "int", "onError": None, "onNull": None}}
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": group_key,
+                "count": {"$sum": 1},
+                "classes": {"$addToSet": "$predicted_class"},
+                "last_seen": {"$max": "$timestamp"}
+            }},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, field: "$_id", "count": 1, "classes": 1, "last_seen": 1}}
+        ]
+        cursor = await self.non_normal_packets_collection.aggregate(pipeline)
+        return await cursor.to_list(length=None)
+
+    async def get_alerts_by_target(self, start: float, end: float, limit: int = 20,
+                                   ipdst: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Alerts per targeted destination address, broken down by class
+
+        :param start: Range start as a unix timestamp (seconds)
+        :param end: Range end as a unix timestamp (seconds)
+        :param limit: Number of targets returned, most attacked first
+        :param ipdst: Only this target
+        :return: Targets with total, count per class, first and last occurrence
+        """
+        match = {"timestamp": {"$gte": start, "$lt": end}}
+        if ipdst is not None:
+            match["ipdst"] = ipdst
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"target": "$ipdst", "class": "$predicted_class"},
+                "count": {"$sum": 1},
+                "first_seen": {"$min": "$timestamp"},
+                "last_seen": {"$max": "$timestamp"}
+            }},
+            {"$group": {
+                "_id": "$_id.target",
+                "total": {"$sum": "$count"},
+                "classes": {"$push": {"k": "$_id.class", "v": "$count"}},
+                "first_seen": {"$min": "$first_seen"},
+                "last_seen": {"$max": "$last_seen"}
+            }},
+            {"$sort": {"total": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "ipdst": "$_id", "total": 1, "first_seen": 1, "last_seen": 1,
+                          "classes": {"$arrayToObject": "$classes"}}}
+        ]
+        cursor = await self.non_normal_packets_collection.aggregate(pipeline)
+        return await cursor.to_list(length=None)
+
     async def get_network_statistics(self):
         """
         Retrieve current network statistics from the database
@@ -172,23 +560,11 @@ class MongoDBClient:
                 # Remove the _id field from the result
                 stats.pop("_id", None)
 
-                # Convert dashed back to normal dots in IP addresses
-                for field in ["top_talkers", "top_attackers"]:
-                    if field in stats:
-                        converted = {}
-                        for key, value in stats[field].items():
-                            converted[key.replace("-", ".")] = value
-                        stats[field] = converted
-
-                # Sort and limit top_ports and top_attacked_ports to top 10
-                for field in ["top_ports", "top_attacked_ports"]:
-                    if field in stats:
-                        # Convert to list of tuples, sort by value (descending), and take top 10
-                        sorted_items = sorted(stats[field].items(),
-                                              key=lambda x: x[1],
-                                              reverse=True)[:10]
-                        # Convert back to dictionary
-                        stats[field] = dict(sorted_items)
+                # Distributions in full, the top tables limited to the top N
+                for field in STATS_HISTORY_DISTRIBUTIONS:
+                    stats[field] = await self._get_counters(field)
+                for field in STATS_IP_DIMENSIONS + STATS_PORT_DIMENSIONS:
+                    stats[field] = await self._get_counters(field, STATS_TOP_N)
 
                 logger.info("Retrieved network statistics from database")
                 return stats
@@ -199,3 +575,58 @@ class MongoDBClient:
         except Exception as e:
             logger.error(f"Error retrieving network statistics: {e}")
             return {}
+
+
+def _bucket_start(timestamp: float, seconds: int) -> datetime:
+    """Start of the bucket of the given size containing a unix timestamp, as UTC datetime"""
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=timezone.utc)
+
+
+def _select_rollup(start: float, step: int):
+    """
+    Pick the coarsest rollup whose bucket size fits in the step and whose
+    retention still covers the start of the range.
+    If the fitting rollups have already expired for that range, the finest
+    rollup that still covers it is used instead.
+    """
+    age = time.time() - start
+    selected = None
+    for name, seconds in STATS_HISTORY_ROLLUPS:
+        retention = STATS_HISTORY_RETENTION[name]
+        covers_range = retention is None or age <= retention
+        if not covers_range:
+            continue
+        if selected is None or seconds <= step:
+            selected = (name, seconds)
+    return selected
+
+
+# One shared client per event loop. AsyncMongoClient may only be used from the
+# loop it runs on, so the web server loop and a threaded consumer loop each get
+# their own; with the shared runtime there is exactly one.
+_clients: Dict[asyncio.AbstractEventLoop, MongoDBClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_mongodb_client() -> MongoDBClient:
+    """
+    Get the shared MongoDB client of the running event loop, created on first use
+
+    :return: MongoDBClient bound to the running loop
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(loop)
+            if client is None:
+                client = MongoDBClient()
+                _clients[loop] = client
+    return client
+
+
+async def close_mongodb_client():
+    """Close and forget the shared MongoDB client of the running event loop"""
+    client: Optional[MongoDBClient] = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -1,12 +1,27 @@
-from typing import Dict, Any, List
-import os
+from typing import Dict, Any, List, Optional, Tuple
 import logging
-from app.mongodb import MongoDBClient
+from app.mongodb import MongoDBClient, get_mongodb_client
+from app.rates import RateTracker
+from app.severity import CLASS_SEVERITY, SEVERITY_NONE, SEVERITY_LOW, SEVERITY_MEDIUM, SEVERITY_HIGH
+from app.networks import protected_networks, format_ip, parse_port, DIRECTION_INBOUND, DIRECTION_OUTBOUND, INVALID_IP
 from dotenv import load_dotenv
+import os
 load_dotenv()
 
 logger = logging.getLogger("myapp")
 
+# Live totals keep at most this many keys per top-N table, the smallest are pruned
+LIVE_TOP_CAPACITY = int(os.getenv("LIVE_TOP_CAPACITY", 10000))
+
+# Statistics fields by kind, as returned by get_statistics
+COUNTER_FIELDS = ["pkt_in", "pkt_out", "low_count", "med_count", "high_count"]
+DISTRIBUTION_FIELDS = ["protocols_count", "services_count", "attack_type_count"]
+IP_TOP_FIELDS = ["top_talkers", "top_attackers"]
+PORT_TOP_FIELDS = ["top_ports", "top_attacked_ports"]
+
+# Packet buffers kept in warm restart snapshots, next to the live totals
+SNAPSHOT_BUFFERS = ["non_normal_packets", "all_packets"]
+
 
 class NetworkStatistics:
     """
@@ -31,18 +46,18 @@ class NetworkStatistics:
         self.high_sev_count = 0
         self.in_size = 0
         self.out_size = 0
-        self.ip = os.getenv("HOST_IP_ADDRESS", "194.233.72.57")
 
         # Distribution tracking
         self.protocol_distribution: Dict[str, int] = {}
         self.service_distribution: Dict[str, int] = {}
         self.attack_type_distribution: Dict[str, int] = {}
 
-        # Top statistics tracking
-        self.top_talkers: Dict[str, int] = {}
-        self.top_ports: Dict[str, int] = {}
-        self.top_attacked_ports: Dict[str, int] = {}
-        self.top_attackers: Dict[str, int] = {}
+        # Top statistics tracking, IPs keyed by integer address (see app.networks)
+        # and ports by integer port, formatted only when leaving the process
+        self.top_talkers: Dict[int, int] = {}
+        self.top_ports: Dict[int, int] = {}
+        self.top_attacked_ports: Dict[int, int] = {}
+        self.top_attackers: Dict[int, int] = {}
 
         # Storage for non-normal packets (for MongoDB)
         self.non_normal_packets: List[Dict[str, Any]] = []
@@ -50,32 +65,58 @@ class NetworkStatistics:
         # Storage for all packets
         self.all_packets: List[Dict[str, Any]] = []
 
+        # Per-second rates, independent of the flush cycle
+        self.rates = RateTracker()
+
+        # Totals since startup of everything already flushed, the live view
+        # is these plus the current transient statistics
+        self.live_totals: Dict[str, Any] = {field: 0 for field in COUNTER_FIELDS}
+        for field in DISTRIBUTION_FIELDS + IP_TOP_FIELDS + PORT_TOP_FIELDS:
+            self.live_totals[field] = {}
+
     def __init__(self):
-        """Initialize network statistics and MongoDB connection"""
+        """Initialize network statistics"""
         self._initialize()
-        # Create dedicated MongoDB connection for RMQ operations
-        self.mongodb = MongoDBClient()
 
-    async def update_statistics(self, result_data: Dict[str, Any]):
+    @property
+    def mongodb(self) -> MongoDBClient:
+        """Shared MongoDB client of the loop the statistics are updated on"""
+        return get_mongodb_client()
+
+    def _accumulate(self, result_data: Dict[str, Any], addresses: Optional[Tuple[int, int, int]] = None,
+                    severity: Optional[int] = None) -> bool:
         """
-        Update network statistics and store non-normal packets
+        Add a single packet to the transient statistics
 
         :param result_data: Packet data with prediction results
+        :param addresses: (source, destination, direction) as computed by
+                          protected_networks.classify, parsed here when omitted
+        :param severity: SEVERITY_* level of the prediction, looked up when omitted
+        :return: True if the packet is an inbound non-normal packet
         """
+        if addresses is None:
+            addresses = protected_networks.classify(
+                result_data["ipsrc"], result_data["ipdst"])
+        src, _, direction = addresses
+        if severity is None:
+            severity = CLASS_SEVERITY.get(result_data["predicted_class"], SEVERITY_NONE)
+        is_attack = severity != SEVERITY_NONE
+
         self.packet_counter += 1
+        self.rates.add(result_data["predicted_class"], result_data["len"], is_attack)
 
         # Severity count tracking
-        if result_data["predicted_class"] == "Probe":
+        if severity == SEVERITY_LOW:
             self.low_sev_count += 1
-        elif result_data["predicted_class"] == "Dos":
+        elif severity == SEVERITY_MEDIUM:
             self.med_sev_count += 1
-        elif result_data["predicted_class"] in ["U2R", "R2L"]:
+        elif severity == SEVERITY_HIGH:
             self.high_sev_count += 1
 
         # Inbound/outbound size tracking
-        if result_data["ipsrc"] == self.ip:
+        if direction & DIRECTION_OUTBOUND:
             self.in_size += result_data["len"]
-        elif result_data["ipdst"] == self.ip:
+        elif direction & DIRECTION_INBOUND:
             self.out_size += result_data["len"]
 
         # Protocol and service distribution
@@ -87,36 +128,77 @@ class NetworkStatistics:
             self.service_distribution.get(result_data["service"], 0) + 1
 
         # Top talkers, ports, and attackers tracking
-        if result_data["ipdst"] == self.ip:
-            # Top talkers by length
-            self.top_talkers[result_data["ipsrc"]] = \
-                self.top_talkers.get(
-                    result_data["ipsrc"], 0) + result_data["len"]
-
-            # Top ports
-            self.top_ports[str(result_data["dport"])] = \
-                self.top_ports.get(str(result_data["dport"]), 0) + 1
-
-            # Attack-specific tracking
-            if result_data["predicted_class"] != "normal":
-                self.top_attacked_ports[str(result_data["dport"])] = \
-                    self.top_attacked_ports.get(
-                        str(result_data["dport"]), 0) + 1
-
-                self.top_attackers[result_data["ipsrc"]] = \
-                    self.top_attackers.get(result_data["ipsrc"], 0) + 1
-
-                self.attack_type_distribution[result_data["predicted_class"]] = \
-                    self.attack_type_distribution.get(
-                        result_data["predicted_class"], 0) + 1
-
-                # Immediately save non-normal packet to MongoDB
-                try:
-                    await self.mongodb.insert_non_normal_packets(result_data)
-                    logger.info(
-                        f"Saved non-normal packet of type {result_data['predicted_class']}")
-                except Exception as e:
-                    logger.error(f"Failed to save non-normal packet: {e}")
+        if not direction & DIRECTION_INBOUND:
+            return False
+
+        # Packets without a valid port (e.g. ICMP) are left out of the port tables
+        dport = parse_port(result_data.get("dport"))
+        valid_src = src != INVALID_IP
+
+        # Top talkers by length
+        if valid_src:
+            self.top_talkers[src] = \
+                self.top_talkers.get(src, 0) + result_data["len"]
+
+        # Top ports
+        if dport is not None:
+            self.top_ports[dport] = self.top_ports.get(dport, 0) + 1
+
+        # Attack-specific tracking
+        if not is_attack:
+            return False
+
+        if dport is not None:
+            self.top_attacked_ports[dport] = \
+                self.top_attacked_ports.get(dport, 0) + 1
+
+        if valid_src:
+            self.top_attackers[src] = self.top_attackers.get(src, 0) + 1
+
+        self.attack_type_distribution[result_data["predicted_class"]] = \
+            self.attack_type_distribution.get(
+                result_data["predicted_class"], 0) + 1
+
+        return True
+
+    def count_unscored(self, direction: int, length: int, protocol: Optional[str] = None):
+        """
+        Count a packet that is not scored from its routing metadata only:
+        packet, byte and protocol counters, no per-host tables or buffers
+
+        :param direction: DIRECTION_* flags of the packet
+        :param length: Packet length in bytes
+        :param protocol: Protocol name, if known
+        """
+        self.packet_counter += 1
+        self.rates.add("normal", length)
+
+        # Same byte accounting as _accumulate
+        if direction & DIRECTION_OUTBOUND:
+            self.in_size += length
+        elif direction & DIRECTION_INBOUND:
+            self.out_size += length
+
+        if protocol:
+            self.protocol_distribution[protocol] = \
+                self.protocol_distribution.get(protocol, 0) + 1
+
+    async def update_statistics(self, result_data: Dict[str, Any],
+                                addresses: Optional[Tuple[int, int, int]] = None):
+        """
+        Update network statistics and store non-normal packets
+
+        :param result_data: Packet data with prediction results
+        :param addresses: (source, destination, direction) of the packet, optional
+        """
+        if self._accumulate(result_data, addresses):
+            # Immediately save non-normal packet to MongoDB
+            try:
+                await self.mongodb.insert_non_normal_packets(result_data)
+                logger.info(
+                    f"Saved non-normal packet of type {result_data['predicted_class']}")
+            except Exception as e:
+                logger.error(f"Failed to save non-normal packet: {e}")
 
         # Store packet in memory
         self._store_all_packets(result_data)
@@ -186,10 +268,100 @@ class NetworkStatistics:
         self.all_packets.clear()
         return packets
 
+    def export_state(self) -> Dict[str, Any]:
+        """
+        Copy of the in-memory state for snapshots.
+        The transient counters are left out: they are flushed every 100
+        packets, so by a crash they are usually in MongoDB already and
+        restoring them would count them twice.
+
+        :return: Picklable dictionary of the live totals and packet buffers
+        """
+        return {
+            "non_normal_packets": self.non_normal_packets.copy(),
+            "all_packets": self.all_packets.copy(),
+            "live_totals": {field: value.copy() if isinstance(value, dict) else value
+                            for field, value in self.live_totals.items()},
+        }
+
+    def restore_state(self, state: Dict[str, Any]):
+        """
+        Restore the in-memory state from a snapshot made by export_state.
+        Only the live totals and packet buffers are read, anything else in
+        the snapshot is ignored.
+
+        :param state: Dictionary returned by export_state
+        """
+        for name in SNAPSHOT_BUFFERS:
+            if isinstance(state.get(name), list):
+                setattr(self, name, state[name])
+
+        live_totals = state.get("live_totals")
+        if isinstance(live_totals, dict):
+            for field in COUNTER_FIELDS:
+                if isinstance(live_totals.get(field), (int, float)):
+                    self.live_totals[field] = live_totals[field]
+            for field in DISTRIBUTION_FIELDS + IP_TOP_FIELDS + PORT_TOP_FIELDS:
+                if isinstance(live_totals.get(field), dict):
+                    self.live_totals[field] = live_totals[field]
+
+    def get_live_statistics(self, top_n: int = 10) -> Dict[str, Any]:
+        """
+        Statistics since startup without a database round trip.
+        Safe to call from another thread than the one updating the statistics.
+
+        :param top_n: Number of entries kept per top-N table
+        :return: Dictionary shaped like the /network-statistics response
+        """
+        current = self.get_statistics()
+        live: Dict[str, Any] = {}
+        for field in COUNTER_FIELDS:
+            live[field] = self.live_totals[field] + current[field]
+
+        for field in DISTRIBUTION_FIELDS + IP_TOP_FIELDS + PORT_TOP_FIELDS:
+            merged = self.live_totals[field].copy()
+            for key, value in current[field].copy().items():
+                merged[key] = merged.get(key, 0) + value
+
+            if field in DISTRIBUTION_FIELDS:
+                live[field] = merged
+                continue
+
+            top = sorted(merged.items(), key=lambda item: item[1], reverse=True)[:top_n]
+            if field in IP_TOP_FIELDS:
+                live[field] = {format_ip(key): value for key, value in top}
+            else:
+                live[field] = {str(key): value for key, value in top}
+
+        live["rates"] = self.rates.snapshot()
+        return live
+
+    def _fold_into_live_totals(self):
+        """
+        Add the transient statistics to the live totals before they are reset
+        """
+        current = self.get_statistics()
+        for field in COUNTER_FIELDS:
+            self.live_totals[field] += current[field]
+
+        for field in DISTRIBUTION_FIELDS + IP_TOP_FIELDS + PORT_TOP_FIELDS:
+            totals = self.live_totals[field]
+            for key, value in current[field].items():
+                totals[key] = totals.get(key, 0) + value
+
+        # Keep the top-N tables bounded, dropping the smallest half when full
+        for field in IP_TOP_FIELDS + PORT_TOP_FIELDS:
+            totals = self.live_totals[field]
+            if len(totals) > LIVE_TOP_CAPACITY:
+                kept = sorted(totals.items(), key=lambda item: item[1],
+                              reverse=True)[:LIVE_TOP_CAPACITY // 2]
+                self.live_totals[field] = dict(kept)
+
     def _reset_transient_stats(self):
         """
         Reset transient statistics after broadcasting
         """
+        self._fold_into_live_totals()
         self.low_sev_count = 0
         self.med_sev_count = 0
         self.high_sev_count = 0
@@ -203,73 +375,42 @@ class NetworkStatistics:
         self.top_attacked_ports.clear()
         self.top_attackers.clear()
 
-    async def update_statistics_batch(self, results: List[Dict[str, Any]]):
+    async def update_statistics_batch(self, results: List[Dict[str, Any]],
+                                      addresses: Optional[List[Tuple[int, int, int]]] = None,
+                                      severities: Optional[List[int]] = None):
         """
         Update network statistics and store non-normal packets
 
         :param results: List Packet data with prediction results
+        :param addresses: (source, destination, direction) per result, optional
+        :param severities: SEVERITY_* level per result, optional
         """
-        for result_data in results:
-
-            self.packet_counter += 1
-
-            # Severity count tracking
-            if result_data["predicted_class"] == "Probe":
-                self.low_sev_count += 1
-            elif result_data["predicted_class"] == "Dos":
-                self.med_sev_count += 1
-            elif result_data["predicted_class"] in ["U2R", "R2L"]:
-                self.high_sev_count += 1
-
-            # Inbound/outbound size tracking
-            if result_data["ipsrc"] == self.ip:
-                self.in_size += result_data["len"]
-            elif result_data["ipdst"] == self.ip:
-                self.out_size += result_data["len"]
-
-            # Protocol and service distribution
-            self.protocol_distribution[result_data["protocol_type"]] = \
-                self.protocol_distribution.get(
-                    result_data["protocol_type"], 0) + 1
-
-            self.service_distribution[result_data["service"]] = \
-                self.service_distribution.get(result_data["service"], 0) + 1
-
-            # Top talkers, ports, and attackers tracking
-            if result_data["ipdst"] == self.ip:
-                # Top talkers by length
-                self.top_talkers[result_data["ipsrc"]] = \
-                    self.top_talkers.get(
-                        result_data["ipsrc"], 0) + result_data["len"]
-
-                # Top ports
-                self.top_ports[str(result_data["dport"])] = \
-                    self.top_ports.get(str(result_data["dport"]), 0) + 1
-
-                # Attack-specific tracking
-                if result_data["predicted_class"] != "normal":
-                    self.top_attacked_ports[str(result_data["dport"])] = \
-                        self.top_attacked_ports.get(
-                            str(result_data["dport"]), 0) + 1
-
-                    self.top_attackers[result_data["ipsrc"]] = \
-                        self.top_attackers.get(result_data["ipsrc"], 0) + 1
-
-                    self.attack_type_distribution[result_data["predicted_class"]] = \
-                        self.attack_type_distribution.get(
-                            result_data["predicted_class"], 0) + 1
-
-                    # Immediately save non-normal packet to MongoDB
-                    try:
-                        await self.mongodb.insert_non_normal_packets(result_data)
-                        logger.info(
-                            f"Saved non-normal packet of type {result_data['predicted_class']}")
-                    except Exception as e:
-                        logger.error(f"Failed to save non-normal packet: {e}")
+        alerts = []
+        for index, result_data in enumerate(results):
+            packet_addresses = addresses[index] if addresses is not None else None
+            severity = severities[index] if severities is not None else None
+
+            # A malformed packet is skipped, not the rest of the batch
+            try:
+                is_alert = self._accumulate(result_data, packet_addresses, severity)
+            except Exception as e:
+                logger.error(f"Failed to count packet statistics: {e}")
+                continue
+
+            if is_alert:
+                alerts.append(result_data)
 
             # Store packet in memory
             self._store_all_packets(result_data)
 
+        # Save the batch's non-normal packets to MongoDB in one insert
+        if alerts:
+            try:
+                await self.mongodb.batch_insert_non_normal_packets(alerts)
+                logger.info(f"Saved {len(alerts)} non-normal packets")
+            except Exception as e:
+                logger.error(f"Failed to save non-normal packets: {e}")
+
         # Save statistics to db every 100 packets
         if self.packet_counter >= 100:
             try:
@@ -0,0 +1,193 @@
+from typing import Any, Iterable, List, Optional, Tuple
+import bisect
+import ipaddress
+import logging
+import os
+import socket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# IPv4 addresses are mapped into ::ffff:0:0/96 so both families share one integer space
+IPV4_MAPPED_PREFIX = 0xFFFF << 32
+IPV4_MAPPED_MASK = ~0xFFFFFFFF
+
+# Returned by parse_ip for addresses that cannot be parsed, never inside a network
+INVALID_IP = -1
+
+# Direction flags, relative to the protected networks
+DIRECTION_TRANSIT = 0
+DIRECTION_INBOUND = 1   # destination is protected
+DIRECTION_OUTBOUND = 2  # source is protected
+
+
+def parse_ip(address: str) -> int:
+    """
+    Parse an IPv4 or IPv6 address into a 128-bit integer
+
+    :param address: Dotted IPv4 or textual IPv6 address
+    :return: Integer address (IPv4 mapped into ::ffff:0:0/96) or INVALID_IP
+    """
+    try:
+        return IPV4_MAPPED_PREFIX | int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except (OSError, TypeError):
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+    except (OSError, TypeError):
+        return INVALID_IP
+
+
+def format_ip(value: int) -> str:
+    """
+    Format an integer address from parse_ip back to text
+
+    :param value: Integer address
+    :return: Dotted IPv4 for mapped addresses, compressed IPv6 otherwise
+    """
+    if value & IPV4_MAPPED_MASK == IPV4_MAPPED_PREFIX:
+        return socket.inet_ntop(socket.AF_INET, (value & 0xFFFFFFFF).to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+
+
+def ip_key(value: int) -> str:
+    """
+    Compact storage key of an integer address (lowercase hex, no separators)
+
+    :param value: Integer address from parse_ip
+    :return: Key usable as a MongoDB field name
+    """
+    return format(value, "x")
+
+
+def ip_from_key(key: str) -> int:
+    """
+    Integer address of a storage key written by ip_key.
+    Also accepts the older dotted-with-dashes keys ("10-0-0-1").
+
+    :param key: Storage key
+    :return: Integer address or INVALID_IP
+    """
+    if "-" in key:
+        return parse_ip(key.replace("-", "."))
+    try:
+        return int(key, 16)
+    except ValueError:
+        return INVALID_IP
+
+
+def ip_bytes(value: int) -> bytes:
+    """
+    Packed 16-byte big-endian form of an integer address, sorts like the integer
+
+    :param value: Integer address from parse_ip
+    :return: Bytes stored as BSON binary
+    """
+    return value.to_bytes(16, "big")
+
+
+def ip_from_bytes(data: bytes) -> int:
+    """
+    Integer address of a value written by ip_bytes
+
+    :param data: Packed address
+    :return: Integer address
+    """
+    return int.from_bytes(data, "big")
+
+
+def parse_port(value: Any) -> Optional[int]:
+    """
+    Port number of a message field, sent as a number or a string
+
+    :param value: Port value, possibly missing or empty (e.g. ICMP)
+    :return: Port between 0 and 65535, or None
+    """
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        return None
+    return port if 0 <= port <= 65535 else None
+
+
+def _network_range(cidr: str) -> Tuple[int, int]:
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    start = int(network.network_address)
+    end = int(network.broadcast_address)
+    if network.version == 4:
+        start |= IPV4_MAPPED_PREFIX
+        end |= IPV4_MAPPED_PREFIX
+    return start, end
+
+
+class NetworkSet:
+    """
+    A set of CIDR networks compiled into sorted, merged integer ranges.
+    Membership of an integer address is a binary search over the range starts.
+    """
+
+    def __init__(self, cidrs: Iterable[str]):
+        self.cidrs: List[str] = [cidr.strip() for cidr in cidrs if cidr.strip()]
+
+        ranges = sorted(_network_range(cidr) for cidr in self.cidrs)
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        for start, end in ranges:
+            if self._ends and start <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __contains__(self, address: int) -> bool:
+        index = bisect.bisect_right(self._starts, address) - 1
+        return index >= 0 and address <= self._ends[index]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def direction(self, src: int, dst: int) -> int:
+        """
+        Classify a packet relative to the networks
+
+        :param src: Integer source address
+        :param dst: Integer destination address
+        :return: DIRECTION_* flags, inbound and outbound combined for internal traffic
+        """
+        direction = DIRECTION_TRANSIT
+        if dst in self:
+            direction |= DIRECTION_INBOUND
+        if src in self:
+            direction |= DIRECTION_OUTBOUND
+        return direction
+
+    def classify(self, ipsrc: str, ipdst: str) -> Tuple[int, int, int]:
+        """
+        Parse both addresses of a packet and classify its direction
+
+        :param ipsrc: Source address text
+        :param ipdst: Destination address text
+        :return: (integer source, integer destination, direction flags)
+        """
+        src = parse_ip(ipsrc)
+        dst = parse_ip(ipdst)
+        return src, dst, self.direction(src, dst)
+
+
+def _load_protected_networks() -> NetworkSet:
+    """
+    Protected networks from PROTECTED_NETWORKS (comma separated CIDRs),
+    falling back to the single HOST_IP_ADDRESS
+    """
+    cidrs = os.getenv("PROTECTED_NETWORKS", "")
+    if not cidrs.strip():
+        cidrs = os.getenv("HOST_IP_ADDRESS", "194.233.72.57")
+    networks = NetworkSet(cidrs.split(","))
+    logger.info(f"Protected networks: {', '.join(networks.cidrs)}")
+    return networks
+
+
+# Global protected network set
+protected_networks = _load_protected_networks()
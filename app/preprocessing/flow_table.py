@@ -0,0 +1,208 @@
+from typing import Dict, Any, List
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.preprocessing import SELECTED_FEATURES
+
+# KDD traffic windows: time based (same host / same service in the last 2 seconds)
+# and host based (same destination host in the last 100 connections)
+WINDOW_SECONDS = 2.0
+HOST_WINDOW_CONNECTIONS = 100
+
+# Connection flags counted as SYN errors and REJ errors
+SERROR_FLAGS = {"S0", "S1", "S2", "S3"}
+RERROR_FLAGS = {"REJ"}
+
+
+class FlowTable:
+    """
+    Sliding window connection table computing the KDD traffic features.
+
+    Every header record is treated as one connection. Records are kept in
+    mirrored ring buffers (each slot is written twice, ``capacity`` apart) so
+    the most recent ``n`` connections are always one contiguous numpy slice.
+    Hosts and services are interned to integer ids to keep the arrays compact.
+
+    The time based window only sees the connections still held, so at more
+    than ``capacity`` connections per ``window_seconds`` (2048/s with the
+    defaults) its counts are capped at ``capacity``.
+    """
+
+    def __init__(self, capacity: int = 4096,
+                 window_seconds: float = WINDOW_SECONDS,
+                 host_window: int = HOST_WINDOW_CONNECTIONS):
+        if capacity < host_window:
+            raise ValueError("capacity must hold at least the host window")
+
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.host_window = host_window
+
+        size = 2 * capacity
+        self._ts = np.zeros(size, dtype=np.float64)
+        self._src = np.zeros(size, dtype=np.int32)
+        self._dst = np.zeros(size, dtype=np.int32)
+        self._service = np.zeros(size, dtype=np.int32)
+        self._sport = np.zeros(size, dtype=np.int32)
+        self._serror = np.zeros(size, dtype=np.bool_)
+        self._rerror = np.zeros(size, dtype=np.bool_)
+
+        # Number of connections currently held and next slot to write
+        self._count = 0
+        self._pos = 0
+
+        # Interning tables, rebuilt from the live window when they grow too large
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._max_ids = 16 * capacity
+
+    def _intern(self, value: str) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = len(self._names)
+            self._ids[value] = value_id
+            self._names.append(value)
+        return value_id
+
+    def _compact_ids(self):
+        """Drop interned values that are no longer referenced by the window"""
+        start, end = self._live_slice()
+        live_ids = np.unique(np.concatenate((
+            self._src[start:end], self._dst[start:end], self._service[start:end])))
+
+        remap = np.zeros(len(self._names), dtype=np.int32)
+        names = [self._names[i] for i in live_ids]
+        remap[live_ids] = np.arange(len(names), dtype=np.int32)
+        # Remap both mirrored halves, dead slots end up on arbitrary valid ids
+        for array in (self._src, self._dst, self._service):
+            array[:] = remap[array]
+
+        self._names = names
+        self._ids = {name: i for i, name in enumerate(names)}
+
+    def _live_slice(self):
+        """Contiguous slice (start, end) covering all connections held, oldest first"""
+        end = self._pos + self.capacity
+        return end - self._count, end
+
+    def _append(self, ts: float, src: int, dst: int, service: int,
+                sport: int, serror: bool, rerror: bool):
+        for slot in (self._pos, self._pos + self.capacity):
+            self._ts[slot] = ts
+            self._src[slot] = src
+            self._dst[slot] = dst
+            self._service[slot] = service
+            self._sport[slot] = sport
+            self._serror[slot] = serror
+            self._rerror[slot] = rerror
+
+        self._pos = (self._pos + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def _traffic_features(self, ts: float, src: int, dst: int,
+                          service: int, sport: int) -> Dict[str, Any]:
+        """Compute the window features of the most recently appended connection"""
+        start, end = self._live_slice()
+
+        # Time based window: connections within the last WINDOW_SECONDS
+        in_time = self._ts[start:end] >= ts - self.window_seconds
+        time_dst = self._dst[start:end][in_time]
+        time_service = self._service[start:end][in_time]
+        time_serror = self._serror[start:end][in_time]
+        time_rerror = self._rerror[start:end][in_time]
+
+        same_host = time_dst == dst
+        same_srv = time_service == service
+        count = int(same_host.sum())
+        srv_count = int(same_srv.sum())
+
+        # Host based window: the last HOST_WINDOW_CONNECTIONS connections, the
+        # dst_host_srv_* features count the same service to any destination
+        host_start = end - min(self._count, self.host_window)
+        host_dst = self._dst[host_start:end]
+        host_service = self._service[host_start:end]
+
+        host_same_host = host_dst == dst
+        host_same_srv = host_service == service
+        dst_host_count = int(host_same_host.sum())
+        dst_host_srv_count = int(host_same_srv.sum())
+
+        return {
+            "count": count,
+            "srv_count": srv_count,
+            "serror_rate": _rate(time_serror, same_host, count),
+            "srv_serror_rate": _rate(time_serror, same_srv, srv_count),
+            "rerror_rate": _rate(time_rerror, same_host, count),
+            "srv_rerror_rate": _rate(time_rerror, same_srv, srv_count),
+            "same_srv_rate": _rate(same_srv, same_host, count),
+            "diff_srv_rate": _rate(~same_srv, same_host, count),
+            "srv_diff_host_rate": _rate(~same_host, same_srv, srv_count),
+            "dst_host_count": dst_host_count,
+            "dst_host_srv_count": dst_host_srv_count,
+            "dst_host_same_srv_rate": _rate(host_same_srv, host_same_host, dst_host_count),
+            "dst_host_diff_srv_rate": _rate(~host_same_srv, host_same_host, dst_host_count),
+            "dst_host_same_src_port_rate": _rate(
+                self._sport[host_start:end] == sport, host_same_host, dst_host_count),
+            "dst_host_srv_diff_host_rate": _rate(
+                ~host_same_host, host_same_srv, dst_host_srv_count),
+            "dst_host_serror_rate": _rate(
+                self._serror[host_start:end], host_same_host, dst_host_count),
+            "dst_host_srv_serror_rate": _rate(
+                self._serror[host_start:end], host_same_srv, dst_host_srv_count),
+            "dst_host_rerror_rate": _rate(
+                self._rerror[host_start:end], host_same_host, dst_host_count),
+            "dst_host_srv_rerror_rate": _rate(
+                self._rerror[host_start:end], host_same_srv, dst_host_srv_count),
+        }
+
+    def ingest(self, records: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Add raw header records to the table and compute their feature rows
+
+        :param records: Header records (timestamp, ipsrc, ipdst, sport, dport,
+                        protocol_type, service, flag, len, ...) in arrival order
+        :return: DataFrame with one row per record and the SELECTED_FEATURES columns
+        """
+        rows = []
+        for record in records:
+            if len(self._names) > self._max_ids:
+                self._compact_ids()
+
+            ts = float(record["timestamp"])
+            flag = record.get("flag", "SF")
+            src = self._intern(record["ipsrc"])
+            dst = self._intern(record["ipdst"])
+            service = self._intern(record["service"])
+            sport = int(record.get("sport", 0))
+
+            self._append(ts, src, dst, service, sport,
+                         flag in SERROR_FLAGS, flag in RERROR_FLAGS)
+
+            row = {
+                "duration": record.get("duration", 0),
+                "protocol_type": record["protocol_type"],
+                "service": record["service"],
+                "flag": flag,
+                "src_bytes": record.get("src_bytes", record.get("len", 0)),
+                "dst_bytes": record.get("dst_bytes", 0),
+                "land": int(record["ipsrc"] == record["ipdst"]
+                            and sport == int(record.get("dport", 0))),
+                "wrong_fragment": record.get("wrong_fragment", 0),
+                "urgent": record.get("urgent", 0),
+            }
+            row.update(self._traffic_features(ts, src, dst, service, sport))
+            rows.append(row)
+
+        return pd.DataFrame(rows, columns=SELECTED_FEATURES)
+
+
+def _rate(values: np.ndarray, mask: np.ndarray, total: int) -> float:
+    """Share of ``values`` set within ``mask``, rounded like the KDD features"""
+    if total == 0:
+        return 0.0
+    return round(float(np.count_nonzero(values & mask)) / total, 2)
+
+
+# Global flow table used by the raw ingest mode of the consumer
+flow_table = FlowTable()
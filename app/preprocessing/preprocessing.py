@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import joblib
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 PREDEFINED_SERVICES = {
     'ssh', 'http', 'smtp', 'domain', 'telnet', 'https', 'ftp',
@@ -17,14 +20,20 @@ SELECTED_FEATURES = [
     'dst_host_srv_serror_rate', 'dst_host_rerror_rate', 'dst_host_srv_rerror_rate'
 ]
 
-# Multi-Class
-preprocessor_path = os.path.join(os.path.dirname(__file__), '../../trained_models/cnn/2505_combined_full/preprocessor.joblib')
+# Multi-Class, same bundle as the model (see app.models.model)
+preprocessor_path = os.path.join(
+    os.getenv("MODEL_BUNDLE_PATH",
+              os.path.join(os.path.dirname(__file__), '../../trained_models/cnn/2505_combined_full')),
+    'preprocessor.joblib')
 preprocessor = joblib.load(preprocessor_path)
 
 
 def preprocess_data(data_list):
-    """Process a batch of network feature dictionaries"""
-    df = pd.DataFrame(data_list)
+    """Process a batch of network feature dictionaries or a feature DataFrame"""
+    if isinstance(data_list, pd.DataFrame):
+        df = data_list.copy()
+    else:
+        df = pd.DataFrame(data_list)
     
     df['service'] = df['service'].apply(
         lambda x: x if x in PREDEFINED_SERVICES else 'other'
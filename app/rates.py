@@ -0,0 +1,114 @@
+from typing import Any, Dict, List, Optional
+import math
+import threading
+import time
+import numpy as np
+from app.severity import CLASS_SEVERITY
+
+# Averaging windows in seconds, the ring holds the longest one
+RATE_WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+
+# Series counted per second, besides one per predicted class
+RATE_SERIES = ["packets", "bytes", "alerts"]
+RATE_CLASSES = list(CLASS_SEVERITY)
+
+
+class RateTracker:
+    """
+    Per-second counters in a ring of one-second buckets, giving packet, byte,
+    alert and per-class rates over the last 1, 5 and 15 minutes plus
+    exponentially weighted moving averages with the same time constants
+    (like Unix load averages).
+
+    Adding is O(1) amortised: the ring only advances over the seconds that
+    passed. Reading sums at most the longest window. Only complete seconds
+    are counted, so rates lag by up to one second.
+    """
+
+    def __init__(self, windows: Optional[Dict[str, int]] = None, clock=time.monotonic):
+        self.windows = windows or RATE_WINDOWS
+        # One bucket more than the longest window for the current, incomplete second
+        self.size = max(self.windows.values()) + 1
+        self.clock = clock
+
+        self.columns: List[str] = RATE_SERIES + RATE_CLASSES
+        self._class_column = {name: len(RATE_SERIES) + i for i, name in enumerate(RATE_CLASSES)}
+        self._other_class = len(self.columns)
+        self.columns.append("other")
+
+        self._ring = np.zeros((self.size, len(self.columns)), dtype=np.int64)
+        self._decay = {name: math.exp(-1 / seconds) for name, seconds in self.windows.items()}
+        self._ewma = {name: np.zeros(len(self.columns)) for name in self.windows}
+        self._second = int(self.clock())
+        self._lock = threading.Lock()
+
+    def _advance(self, second: int):
+        """Close the seconds up to the given one, zeroing their buckets"""
+        elapsed = second - self._second
+        if elapsed <= 0:
+            return
+
+        # Completed seconds feed the averages, empty ones only decay them
+        closed = self._ring[self._second % self.size]
+        for name, decay in self._decay.items():
+            ewma = self._ewma[name]
+            ewma *= decay
+            ewma += closed * (1 - decay)
+            if elapsed > 1:
+                ewma *= decay ** (elapsed - 1)
+
+        if elapsed >= self.size:
+            self._ring[:] = 0
+        else:
+            for offset in range(1, elapsed + 1):
+                self._ring[(self._second + offset) % self.size] = 0
+        self._second = second
+
+    def add(self, predicted_class: str, length: int, alert: bool = False):
+        """
+        Count one packet
+
+        :param predicted_class: Predicted class of the packet
+        :param length: Packet length in bytes
+        :param alert: True for a non-normal packet
+        """
+        with self._lock:
+            self._advance(int(self.clock()))
+            row = self._ring[self._second % self.size]
+            row[0] += 1
+            row[1] += length
+            if alert:
+                row[2] += 1
+            row[self._class_column.get(predicted_class, self._other_class)] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current rates per second
+
+        :return: {"packets": {...}, "bytes": {...}, "alerts": {...}, "classes": {class: {...}}},
+                 each with the windowed rates ("1m", ...) and averages ("ewma_1m", ...)
+        """
+        with self._lock:
+            self._advance(int(self.clock()))
+            current = self._second % self.size
+            # Complete seconds, newest first
+            order = (current - 1 - np.arange(self.size - 1)) % self.size
+            cumulative = np.cumsum(self._ring[order], axis=0)
+            ewma = {name: values.copy() for name, values in self._ewma.items()}
+
+        rates = {}
+        for name, seconds in self.windows.items():
+            rates[name] = cumulative[seconds - 1] / seconds
+
+        def series(column: int) -> Dict[str, float]:
+            values = {name: round(float(rates[name][column]), 3) for name in self.windows}
+            for name in self.windows:
+                values[f"ewma_{name}"] = round(float(ewma[name][column]), 3)
+            return values
+
+        snapshot = {name: series(column) for column, name in enumerate(RATE_SERIES)}
+        snapshot["classes"] = {
+            name: series(column) for column, name in enumerate(self.columns)
+            if column >= len(RATE_SERIES)
+        }
+        return snapshot
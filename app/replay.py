@@ -0,0 +1,262 @@
+"""
+Offline replay / backfill: rescore a JSONL capture with the current model.
+
+Every input line is a packet message as published to the RMQ queue (KDD
+features plus ``additional_data``). The file is streamed in chunks which are
+scored in parallel worker processes through the same preprocess + predict path
+as the live consumer. Results go to MongoDB (bulk inserts) or to Parquet files.
+Progress is checkpointed after every chunk so interrupted runs can resume.
+
+    python -m app.replay capture.jsonl --sink mongo --collection replay_results
+    python -m app.replay capture.jsonl --sink parquet --output-dir replay/ --resume
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Any, Dict, Iterator, List, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("myapp")
+
+
+def _init_worker(threads: int):
+    """Load the model once per worker process, without a nested inference pool"""
+    os.environ["INFERENCE_WORKERS"] = "0"
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    import app.models.model  # noqa: F401
+
+
+def _score_chunk(lines: List[bytes], offsets: List[int],
+                 score_all: bool) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Score one chunk of input lines in a worker process
+
+    :param lines: Raw JSON lines
+    :param offsets: Byte offset of every line, used as a stable row id
+    :param score_all: Score outbound packets too instead of labelling them normal
+    :return: (result rows in input order, offsets of the lines that could not be decoded)
+    """
+    from app.models.model import predict
+    from app.networks import protected_networks, DIRECTION_INBOUND
+
+    packets, packet_offsets, scored, bad_offsets = [], [], [], []
+    for line, offset in zip(lines, offsets):
+        try:
+            packet = json.loads(line)
+            additional_data = packet["additional_data"]
+            direction = protected_networks.classify(additional_data["ipsrc"], additional_data["ipdst"])[2]
+        except (ValueError, KeyError, TypeError):
+            bad_offsets.append(offset)
+            continue
+        packets.append(packet)
+        packet_offsets.append(offset)
+        scored.append(score_all or bool(direction & DIRECTION_INBOUND))
+
+    to_score = [p for p, s in zip(packets, scored) if s]
+    predictions = iter(predict(to_score) if to_score else [])
+
+    results = []
+    for packet, offset, is_scored in zip(packets, packet_offsets, scored):
+        prediction = next(predictions) if is_scored else {"predicted_class": "normal", "confidence": 0.0}
+        results.append({"offset": offset, **packet["additional_data"], **prediction})
+    return results, bad_offsets
+
+
+def _read_chunks(path: str, start: int, chunk_size: int) -> Iterator[Tuple[List[bytes], List[int], int]]:
+    """
+    Stream non-empty lines from ``start`` in chunks
+
+    :return: Iterator of (lines, line offsets, offset after the chunk)
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        lines, offsets = [], []
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            lines.append(line)
+            offsets.append(line_offset)
+            if len(lines) >= chunk_size:
+                yield lines, offsets, offset
+                lines, offsets = [], []
+        if lines:
+            yield lines, offsets, offset
+
+
+class MongoSink:
+    """
+    Bulk inserts result rows, row ids ("<resolved input path>:<offset>") make
+    re-inserting a chunk harmless and keep captures of the same name apart
+    """
+
+    def __init__(self, collection: str, run_id: str):
+        from app.mongodb import get_mongodb_client
+        self.client = get_mongodb_client()
+        self.collection = self.client.collection(collection)
+        self.run_id = run_id
+
+    async def write(self, rows: List[Dict[str, Any]], chunk_offset: int):
+        from pymongo.errors import BulkWriteError
+
+        documents = [{"_id": f"{self.run_id}:{row.pop('offset')}", **row} for row in rows]
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys come from a chunk already written before a resume
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if errors:
+                raise
+
+    async def close(self):
+        from app.mongodb import close_mongodb_client
+        await close_mongodb_client()
+
+
+class ParquetSink:
+    """
+    Writes one Parquet file per chunk, named after the chunk's start offset,
+    with the traffic archive's schema
+    """
+
+    def __init__(self, output_dir: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("The parquet sink requires pyarrow (pip install pyarrow)")
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    async def write(self, rows: List[Dict[str, Any]], chunk_offset: int):
+        import pyarrow.parquet as pq
+        from app.archive import archive_table
+
+        path = os.path.join(self.output_dir, f"part-{chunk_offset:015d}.parquet")
+        # Same schema as the traffic archive, plus the input offset of each row
+        table = archive_table(rows, {"offset": "int64"})
+        await asyncio.to_thread(pq.write_table, table, path, compression="zstd")
+
+    async def close(self):
+        pass
+
+
+def _load_checkpoint(path: str, input_path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"offset": 0, "rows": 0, "skipped": 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('input')}")
+    return checkpoint
+
+
+def _save_checkpoint(path: str, input_path: str, offset: int, rows: int, skipped: int):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"input": os.path.abspath(input_path), "offset": offset,
+                   "rows": rows, "skipped": skipped, "updated_at": time.time()}, f)
+    os.replace(temp_path, path)
+
+
+async def replay(args: argparse.Namespace):
+    checkpoint_path = args.checkpoint or f"{args.input}.checkpoint.json"
+    checkpoint = _load_checkpoint(checkpoint_path, args.input) if args.resume \
+        else {"offset": 0, "rows": 0, "skipped": 0}
+    start_offset, total_rows = checkpoint["offset"], checkpoint["rows"]
+    total_skipped = checkpoint.get("skipped", 0)
+    if start_offset:
+        logger.info(f"Resuming at byte {start_offset} after {total_rows} rows")
+
+    if args.sink == "mongo":
+        sink = MongoSink(args.collection, os.path.realpath(args.input))
+    else:
+        sink = ParquetSink(args.output_dir)
+
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.worker_threads,)
+    )
+
+    # Chunks are scored out of order but written and checkpointed in order
+    in_flight = deque()
+    started = time.perf_counter()
+    session_rows = 0
+
+    async def drain_one():
+        nonlocal total_rows, session_rows, total_skipped
+        future, chunk_offset, end_offset = in_flight.popleft()
+        rows, bad_offsets = await future
+        # Undecodable lines are skipped, the rest of the run goes on
+        for offset in bad_offsets:
+            logger.warning(f"Skipped undecodable line at byte {offset}")
+        total_skipped += len(bad_offsets)
+        if rows:
+            await sink.write(rows, chunk_offset)
+        total_rows += len(rows)
+        session_rows += len(rows)
+        _save_checkpoint(checkpoint_path, args.input, end_offset, total_rows, total_skipped)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"{total_rows} rows replayed, {session_rows / elapsed:,.0f} rows/sec")
+
+    try:
+        for lines, offsets, end_offset in _read_chunks(args.input, start_offset, args.chunk_size):
+            future = loop.run_in_executor(executor, _score_chunk, lines, offsets, args.score_all)
+            in_flight.append((future, offsets[0], end_offset))
+            if len(in_flight) >= args.workers * 2:
+                await drain_one()
+        while in_flight:
+            await drain_one()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        await sink.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Replay finished: {session_rows} rows in {elapsed:.1f} s "
+        f"({session_rows / max(elapsed, 1e-9):,.0f} rows/sec), {total_rows} rows in total, "
+        f"{total_skipped} lines skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m app.replay",
+        description="Rescore a JSONL packet capture with the current model")
+    parser.add_argument("input", help="JSONL file, one RMQ packet message per line")
+    parser.add_argument("--sink", choices=["mongo", "parquet"], default="mongo")
+    parser.add_argument("--collection", default="replay_results",
+                        help="MongoDB collection for the mongo sink")
+    parser.add_argument("--output-dir", default="replay_output",
+                        help="Directory for the parquet sink")
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Scoring processes")
+    parser.add_argument("--worker-threads", type=int, default=1,
+                        help="TensorFlow threads per scoring process")
+    parser.add_argument("--score-all", action="store_true",
+                        help="Also score outbound packets (the live consumer labels them normal)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <input>.checkpoint.json)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint")
+    args = parser.parse_args()
+
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
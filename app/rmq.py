@@ -1,11 +1,19 @@
 import logging
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 import aio_pika
+import aiormq
 import asyncio
 import json
-from app.models.model import predict as model_predict
+from app.models.model import predict as model_predict, predict_columnar
 from app.api.websockets.ws import manager as ws_manager
 from app.network_statistics import network_stats_service
+from app.preprocessing.flow_table import flow_table
+from app.networks import protected_networks, parse_port, DIRECTION_TRANSIT, DIRECTION_INBOUND, DIRECTION_OUTBOUND
+from app.flood import flood_guard
+from app.archive import archiver
+from app.alert_store import alert_store
+from app.severity import CLASS_SEVERITY, SEVERITY_NAMES, SEVERITY_NONE
 from dotenv import load_dotenv
 import os
 import time
@@ -13,6 +21,27 @@ load_dotenv()
 
 logger = logging.getLogger("myapp")
 
+# Ingest modes: "features" messages carry the precomputed KDD features,
+# "raw" messages are header records whose window features come from the flow table
+INGEST_MODE_FEATURES = "features"
+INGEST_MODE_RAW = "raw"
+
+# Values of the optional "direction" message header set by the sniffer
+HEADER_DIRECTIONS = {
+    "inbound": DIRECTION_INBOUND,
+    "outbound": DIRECTION_OUTBOUND,
+    "internal": DIRECTION_INBOUND | DIRECTION_OUTBOUND,
+    "transit": DIRECTION_TRANSIT,
+}
+# Protocols the model can score, others are only counted
+SCORABLE_PROTOCOLS = {"tcp", "udp", "icmp"}
+
+# Results published downstream: only non-normal ones or every scored packet
+PUBLISH_ALERTS = "alerts"
+PUBLISH_ALL = "all"
+# Seconds to wait for the broker to confirm the results of one batch
+RESULTS_PUBLISH_TIMEOUT = float(os.getenv("RMQ_RESULTS_PUBLISH_TIMEOUT", 10))
+
 
 class PikaClient:
     def __init__(self, queue_name: str, host: str, port: int, user: str, password: str):
@@ -33,6 +62,25 @@ class PikaClient:
 
         self.consumed_packet_counter = 0
 
+        self.ingest_mode = os.getenv("RMQ_INGEST_MODE", INGEST_MODE_FEATURES).lower()
+
+        # On the web server loop ("shared" runtime) inference runs on its own
+        # thread, so HTTP and WebSocket traffic keep flowing during a batch
+        self.inference_executor = None
+        if os.getenv("CONSUMER_RUNTIME", "thread").lower() == "shared":
+            self.inference_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="consumer-inference")
+
+        # Route messages by their headers / routing key where possible, so
+        # packets that are never scored are counted without decoding the body
+        self.header_routing = os.getenv("RMQ_HEADER_ROUTING", "true").lower() == "true"
+
+        # Optional downstream topic exchange for scored results, disabled when empty
+        self.results_exchange_name = os.getenv("RMQ_RESULTS_EXCHANGE", "")
+        self.results_publish = os.getenv("RMQ_RESULTS_PUBLISH", PUBLISH_ALERTS).lower()
+        self.publish_channel: aio_pika.abc.AbstractChannel = None
+        self.results_exchange: aio_pika.abc.AbstractExchange = None
+
     async def start_connection(self):
         try:
             logger.info("Starting RabbitMQ connection")
@@ -45,6 +93,8 @@ class PikaClient:
 
             self.channel = await self.connection.channel()
             await self.setup_queue()
+            if self.results_exchange_name:
+                await self.setup_results_exchange()
         except Exception as e:
             logger.error(f"RabbitMQ connection error: {e}")
 
@@ -52,6 +102,61 @@ class PikaClient:
         logger.info(f"Setting up queue: {self.queue_name}")
         self.queue = await self.channel.declare_queue(name=self.queue_name, durable=True)
 
+    async def setup_results_exchange(self):
+        logger.info(f"Setting up results exchange: {self.results_exchange_name}")
+        # Separate channel so confirms never wait behind consumer traffic
+        self.publish_channel = await self.connection.channel(publisher_confirms=True)
+        self.results_exchange = await self.publish_channel.declare_exchange(
+            name=self.results_exchange_name, type=aio_pika.ExchangeType.TOPIC, durable=True)
+
+    def publish_results(self, results: List[Dict[str, Any]]) -> asyncio.Future:
+        """
+        Publish scored results to the results exchange, one message per routing
+        key ("<severity>.<class>", e.g. "high.R2L") holding a JSON list.
+        All messages are sent at once and their confirms awaited together.
+        Messages are not mandatory: routing keys nobody binds are dropped by
+        the broker and still confirmed.
+
+        :param results: Scored results of one consumer batch
+        :return: Future resolving to the broker's confirmation frames
+        """
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        if self.results_exchange is not None:
+            for result in results:
+                predicted_class = result["predicted_class"]
+                if self.results_publish != PUBLISH_ALL and predicted_class == "normal":
+                    continue
+                severity = SEVERITY_NAMES[CLASS_SEVERITY.get(predicted_class, SEVERITY_NONE)]
+                groups.setdefault(f"{severity}.{predicted_class}", []).append(result)
+
+        return asyncio.gather(*(
+            self.results_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(group, separators=(",", ":")).encode(),
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    headers={"count": len(group)}
+                ),
+                routing_key=routing_key,
+                mandatory=False
+            )
+            for routing_key, group in groups.items()
+        ))
+
+    @staticmethod
+    async def wait_confirmed(published: asyncio.Future):
+        """
+        Wait for the confirms of publish_results()
+
+        :param published: Future returned by publish_results()
+        :raises RuntimeError: If the broker nacked or rejected a message
+        :raises asyncio.TimeoutError: If the confirms take longer than RMQ_RESULTS_PUBLISH_TIMEOUT
+        """
+        confirmations = await asyncio.wait_for(published, RESULTS_PUBLISH_TIMEOUT)
+        for confirmation in confirmations:
+            if not isinstance(confirmation, aiormq.spec.Basic.Ack):
+                raise RuntimeError(f"Results not confirmed by the broker: {confirmation}")
+
     async def start_consumer(self):
         await self.start_connection()
         # await self.channel.set_qos(prefetch_count=1)
@@ -67,16 +172,60 @@ class PikaClient:
 
         return self
 
+    @staticmethod
+    def _route(message: aio_pika.abc.AbstractIncomingMessage) -> Optional[Tuple[int, int, Optional[str]]]:
+        """
+        Routing metadata of a message from its headers, falling back to a
+        "<direction>.<protocol>" routing key
+
+        Headers: ipsrc and ipdst (direction computed against the protected
+        networks), or direction (inbound, outbound, internal, transit);
+        len; protocol.
+
+        :return: (direction flags, length, protocol) if the message does not
+                 need scoring, None if it must be decoded
+        """
+        headers = message.headers or {}
+
+        def header(name: str) -> Optional[str]:
+            value = headers.get(name)
+            return value.decode() if isinstance(value, bytes) else value
+
+        ipsrc, ipdst = header("ipsrc"), header("ipdst")
+        protocol = header("protocol")
+        if ipsrc and ipdst:
+            direction = protected_networks.classify(ipsrc, ipdst)[2]
+        elif header("direction") in HEADER_DIRECTIONS:
+            direction = HEADER_DIRECTIONS[header("direction")]
+        else:
+            parts = (message.routing_key or "").split(".")
+            if parts[0] not in HEADER_DIRECTIONS:
+                return None
+            direction = HEADER_DIRECTIONS[parts[0]]
+            protocol = protocol or (parts[1] if len(parts) > 1 else None)
+
+        protocol = protocol.lower() if protocol else None
+        scorable = protocol is None or protocol in SCORABLE_PROTOCOLS
+        if direction & DIRECTION_INBOUND and scorable:
+            return None
+
+        # Without a length the packet still has to be decoded to be counted
+        try:
+            return direction, int(header("len")), protocol
+        except (TypeError, ValueError):
+            return None
+
     async def handle_message(self, message: aio_pika.abc.AbstractIncomingMessage):
         """Handle incoming packet message"""
         try:
             # Parse packet
             packet = json.loads(message.body)
             additional_data = packet["additional_data"]
-            host_ip = os.getenv("HOST_IP_ADDRESS", "194.233.72.57")
+            addresses = protected_networks.classify(
+                additional_data["ipsrc"], additional_data["ipdst"])
 
             # Determine if packet is inbound or outbound
-            if additional_data["ipdst"] == host_ip:
+            if addresses[2] & DIRECTION_INBOUND:
                 # Inbound packet: run normal inference
                 prediction_result = model_predict([packet])[0]
             else:
@@ -92,22 +241,15 @@ class PikaClient:
                 **prediction_result
             }
 
-            # Create tasks for concurrent execution
-            tasks = [
-                asyncio.create_task(
-                    network_stats_service.update_statistics(result_data))
-            ]
+            await network_stats_service.update_statistics(result_data, addresses)
 
-            # Add broadcast task only for non-normal packets
+            # Hand non-normal packets over to the WebSocket clients
             if prediction_result['predicted_class'] != 'normal':
-                tasks.append(asyncio.create_task(
-                    ws_manager.broadcast(result_data)))
+                ws_manager.publish([result_data])
+                alert_store.add([result_data])
                 logger.warning(
                     f"[ALERT] Potential intrusion: {prediction_result['predicted_class']}")
 
-            # Wait for all tasks to complete
-            await asyncio.gather(*tasks)
-
             # Manual acknowledgement
             await message.ack()
 
@@ -125,73 +267,168 @@ class PikaClient:
     async def process_message_batch(self, messages):
         """Process a batch of messages together"""
         try:
+            # Outbound and unscorable packets known from their headers are only
+            # counted. Raw records always feed the flow table windows.
+            to_decode = messages
+            unscored = []
+            if self.header_routing and self.ingest_mode != INGEST_MODE_RAW:
+                to_decode = []
+                for msg in messages:
+                    route = self._route(msg)
+                    if route is None:
+                        to_decode.append(msg)
+                    else:
+                        unscored.append(route)
+
             # Extract packets from messages
-            packets = [json.loads(msg.body) for msg in messages]
-            host_ip = os.getenv("HOST_IP_ADDRESS", "194.233.72.57")
+            if self.ingest_mode == INGEST_MODE_RAW:
+                packets = [self._packet_from_record(json.loads(msg.body))
+                           for msg in to_decode]
+                # Every record feeds the windows, features are kept per row
+                features = flow_table.ingest(
+                    [p["additional_data"] for p in packets])
+            else:
+                packets = [json.loads(msg.body) for msg in to_decode]
+                features = None
 
-            # Split packets into inbound and outbound
+            # Split packets into inbound and outbound, addresses are parsed
+            # once here and handed on to the statistics
             inbound_packets = []
+            inbound_rows = []
+            inbound_addresses = []
+            held_results = []
+            held_addresses = []
             outbound_results = []
+            outbound_addresses = []
 
-            for packet in packets:
+            for row, packet in enumerate(packets):
 
                 # add t2 time, time when packet is received
                 packet["evaluation_time"]["t2"] = time.time() * 1000
 
-                if packet["additional_data"]["ipdst"] == host_ip:
+                additional_data = packet["additional_data"]
+                addresses = protected_networks.classify(
+                    additional_data["ipsrc"], additional_data["ipdst"])
+
+                if addresses[2] & DIRECTION_INBOUND:
+                    # Packets of a confirmed flood are labelled without the model,
+                    # packets without a port (e.g. ICMP) always go through it
+                    dport = parse_port(additional_data.get("dport"))
+                    held = flood_guard.check(addresses[0], dport) \
+                        if flood_guard is not None and dport is not None else None
+                    if held is not None:
+                        held_addresses.append(addresses)
+                        held_results.append(
+                            {**additional_data, **held, **packet["evaluation_time"]})
+                        continue
+
                     inbound_packets.append(packet)
+                    inbound_rows.append(row)
+                    inbound_addresses.append(addresses)
                 else:
+                    outbound_addresses.append(addresses)
                     outbound_results.append({
                         "predicted_class": "normal",
                         "confidence": 0.0,
                         **packet["additional_data"]
                     })
 
-            # Batch predict inbound packets
+            # Batch predict inbound packets, reading the columns directly
             if inbound_packets:
-                predictions = model_predict(inbound_packets)
+                columns = await self._predict_columnar(
+                    features.iloc[inbound_rows] if features is not None else inbound_packets)
+                labels = columns.labels().tolist()
+                confidences = columns.confidence.tolist()
+                inbound_severities = columns.severity.tolist()
                 inbound_results = [
-                    {**p["additional_data"], **pred, **p["evaluation_time"]}
-                    for p, pred in zip(inbound_packets, predictions)
+                    {**p["additional_data"], "predicted_class": label, "confidence": confidence,
+                     **p["evaluation_time"]}
+                    for p, label, confidence in zip(inbound_packets, labels, confidences)
                 ]
+                if flood_guard is not None:
+                    for addresses, packet, label, confidence in zip(
+                            inbound_addresses, inbound_packets, labels, confidences):
+                        dport = parse_port(packet["additional_data"].get("dport"))
+                        if dport is not None:
+                            flood_guard.confirm(addresses[0], dport, label, confidence)
             else:
                 inbound_results = []
+                inbound_severities = []
 
             post_prediction_time = time.time() * 1000
             # add t3 time, time after packets inferenced
-            for result in inbound_results:
+            for result in inbound_results + held_results:
                 result["t3"] = post_prediction_time
 
             # Combine results
-            all_results = inbound_results + outbound_results
+            all_results = inbound_results + held_results + outbound_results
+            severities = inbound_severities \
+                + [CLASS_SEVERITY.get(result["predicted_class"], SEVERITY_NONE) for result in held_results] \
+                + [SEVERITY_NONE] * len(outbound_results)
+
+            # Results are confirmed downstream before anything else sees them,
+            # so a nack and redelivery never counts, stores or pushes a batch twice
+            await self.wait_confirmed(self.publish_results(all_results))
+        except Exception as e:
+            logger.error(f"Batch processing error: {e}")
+            # Nack all messages on error
+            for message in messages:
+                await message.nack(requeue=True)
+            return
+
+        # Once confirmed the batch is acked even if a local side effect fails,
+        # redelivering it would publish its results again
+        try:
+            for route in unscored:
+                network_stats_service.count_unscored(*route)
+            archiver.append(all_results)
+
             # Process statistics update in batch
-            await network_stats_service.update_statistics_batch(all_results)
-
-        # Handle broadcasts separately for non-normal packets
-            broadcast_tasks = []
-            for result in all_results:
-                if result['predicted_class'] != 'normal':
-                    # this make the broadcast task to be executed concurrently
-                    broadcast_tasks.append(asyncio.create_task(
-                        ws_manager.broadcast(result)
-                    ))
+            await network_stats_service.update_statistics_batch(
+                all_results, inbound_addresses + held_addresses + outbound_addresses, severities)
+
+            # Hand non-normal packets over to the WebSocket clients in one go,
+            # sending happens on the web server loop
+            alerts = []
+            for result, severity in zip(all_results, severities):
+                if severity != SEVERITY_NONE:
+                    alerts.append(result)
                     logger.warning(
                         f"[ALERT] Potential intrusion: {result['predicted_class']}")
+            ws_manager.publish(alerts)
+            alert_store.add(alerts)
+        except Exception as e:
+            logger.error(f"Batch post-processing error: {e}")
 
-            if broadcast_tasks:
-                await asyncio.gather(*broadcast_tasks)
-
-            # Acknowledge all messages, one by one
+        # Acknowledge all messages, one by one
+        try:
             for message in messages:
                 await message.ack()
-
-            # logger.warning(f"Processed {self.consumed_packet_counter} packets")
-
         except Exception as e:
-            logger.error(f"Batch processing error: {e}")
-            # Nack all messages on error
-            for message in messages:
-                await message.nack(requeue=True)
+            logger.error(f"Batch acknowledgement error: {e}")
+
+        # logger.warning(f"Processed {self.consumed_packet_counter} packets")
+
+    async def _predict_columnar(self, data):
+        """predict_columnar(), on the inference thread when the loop is shared"""
+        if self.inference_executor is None:
+            return predict_columnar(data)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.inference_executor, predict_columnar, data)
+
+    @staticmethod
+    def _packet_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Wrap a raw header record into the packet layout of the features mode
+
+        :param record: Raw header record, optionally carrying evaluation_time
+        :return: Packet with additional_data and evaluation_time
+        """
+        evaluation_time = record.pop("evaluation_time", {})
+        return {
+            "additional_data": record,
+            "evaluation_time": evaluation_time
+        }
 
     async def handle_message_batch(self, message: aio_pika.abc.AbstractIncomingMessage):
         """Handle incoming packet message"""
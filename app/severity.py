@@ -0,0 +1,22 @@
+# Alert severity levels and the severity of each predicted class
+
+SEVERITY_NONE = 0
+SEVERITY_LOW = 1
+SEVERITY_MEDIUM = 2
+SEVERITY_HIGH = 3
+
+SEVERITY_NAMES = {
+    SEVERITY_NONE: "none",
+    SEVERITY_LOW: "low",
+    SEVERITY_MEDIUM: "medium",
+    SEVERITY_HIGH: "high",
+}
+SEVERITY_BY_NAME = {name: level for level, name in SEVERITY_NAMES.items()}
+
+CLASS_SEVERITY = {
+    "normal": SEVERITY_NONE,
+    "Probe": SEVERITY_LOW,
+    "Dos": SEVERITY_MEDIUM,
+    "U2R": SEVERITY_HIGH,
+    "R2L": SEVERITY_HIGH,
+}
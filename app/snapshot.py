@@ -0,0 +1,137 @@
+from typing import Any, Dict
+import asyncio
+import logging
+import os
+import pickle
+import time
+import zlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("myapp")
+
+# Snapshot file location, snapshots are disabled when empty
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", 15))
+# Snapshots older than this are ignored on startup
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", 3600))
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class StateSnapshotter:
+    """
+    Periodically checkpoints in-memory state to a local snapshot file and
+    restores it on startup.
+
+    State is collected from registered providers, objects with
+    ``export_state()`` returning a picklable copy of their state and
+    ``restore_state(state)``. The snapshot is pickled, zlib compressed and
+    written atomically (temporary file + rename).
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH,
+                 interval: float = SNAPSHOT_INTERVAL_SECONDS,
+                 max_age: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._providers: Dict[str, Any] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def register(self, name: str, provider: Any):
+        """
+        Register a state provider
+
+        :param name: Unique name of the state inside the snapshot
+        :param provider: Object with export_state() and restore_state(state)
+        """
+        self._providers[name] = provider
+
+    def _export(self) -> Dict[str, Any]:
+        return {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "saved_at": time.time(),
+            "state": {name: provider.export_state() for name, provider in self._providers.items()}
+        }
+
+    def _write(self, snapshot: Dict[str, Any]):
+        data = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return len(data)
+
+    async def checkpoint(self):
+        """
+        Write a snapshot. State is exported on the calling loop, which must be
+        the loop mutating it; compression and file IO run on a worker thread.
+        """
+        if not self.enabled:
+            return
+        try:
+            started = time.perf_counter()
+            size = await asyncio.to_thread(self._write, self._export())
+            logger.debug(
+                f"Wrote state snapshot ({size} bytes) in {(time.perf_counter() - started) * 1000:.1f} ms")
+        except Exception as e:
+            logger.error(f"Failed to write state snapshot: {e}")
+
+    def restore(self) -> bool:
+        """
+        Restore registered providers from the snapshot file, if a recent one exists
+
+        :return: True if a snapshot was restored
+        """
+        if not self.enabled or not os.path.exists(self.path):
+            return False
+
+        try:
+            started = time.perf_counter()
+            with open(self.path, "rb") as f:
+                snapshot = pickle.loads(zlib.decompress(f.read()))
+
+            if snapshot.get("version") != SNAPSHOT_FORMAT_VERSION:
+                logger.warning(f"Ignoring state snapshot with version {snapshot.get('version')}")
+                return False
+
+            age = time.time() - snapshot["saved_at"]
+            if age > self.max_age:
+                logger.warning(f"Ignoring state snapshot, it is {age:.0f} seconds old")
+                return False
+
+            for name, state in snapshot["state"].items():
+                provider = self._providers.get(name)
+                if provider is not None:
+                    provider.restore_state(state)
+
+            logger.info(
+                f"Restored state snapshot from {age:.1f} seconds ago "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to restore state snapshot: {e}")
+            return False
+
+    async def run(self):
+        """Checkpoint every interval until cancelled"""
+        if not self.enabled:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.checkpoint()
+
+
+# Global snapshotter instance
+snapshotter = StateSnapshotter()
@@ -0,0 +1,61 @@
+"""
+Throughput benchmark of the flow table feature engine.
+
+Feeds synthetic header records through FlowTable.ingest in consumer sized
+batches and reports records/sec.
+
+    python -m benchmarks.flow_table --records 50000 --batch-size 15
+"""
+import argparse
+import random
+import time
+
+from app.preprocessing.flow_table import FlowTable
+
+SERVICES = ["http", "https", "ssh", "smtp", "domain", "ftp", "telnet"]
+FLAGS = ["SF", "SF", "SF", "S0", "REJ", "RSTO"]
+
+
+def synthetic_records(count: int, hosts: int, rate: float):
+    """Generate header records arriving at ``rate`` records per second"""
+    start = time.time()
+    for i in range(count):
+        yield {
+            "timestamp": start + i / rate,
+            "ipsrc": f"10.0.{random.randint(0, 3)}.{random.randint(1, hosts)}",
+            "ipdst": f"192.168.1.{random.randint(1, 8)}",
+            "sport": random.randint(1024, 65535),
+            "dport": 80,
+            "protocol_type": "tcp",
+            "service": random.choice(SERVICES),
+            "flag": random.choice(FLAGS),
+            "len": random.randint(40, 1500),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=15)
+    parser.add_argument("--hosts", type=int, default=250)
+    parser.add_argument("--rate", type=float, default=2000.0,
+                        help="simulated arrival rate, sets the 2 second window size")
+    parser.add_argument("--capacity", type=int, default=4096)
+    args = parser.parse_args()
+
+    table = FlowTable(capacity=args.capacity)
+    records = list(synthetic_records(args.records, args.hosts, args.rate))
+
+    started = time.perf_counter()
+    for i in range(0, len(records), args.batch_size):
+        table.ingest(records[i:i + args.batch_size])
+    elapsed = time.perf_counter() - started
+
+    print(f"records:     {args.records}")
+    print(f"batch size:  {args.batch_size}")
+    print(f"elapsed:     {elapsed:.3f} s")
+    print(f"throughput:  {args.records / elapsed:,.0f} records/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Latency, throughput and agreement of the trained model bundles.
+
+Every bundle (a directory with model.h5, label_encoder.pkl and
+preprocessor.joblib) is loaded in its own process through the application's
+preprocess + predict path, selected with MODEL_BUNDLE_PATH. Per bundle the
+benchmark reports load time (including graph warm-up, excluding the
+TensorFlow import), resident memory, p50/p99 latency and rows/sec per batch
+size, and how often its predictions agree with the reference bundle (and
+with the labels, when the dataset has them).
+
+The dataset is a JSONL file of packet messages as published to the RMQ
+queue (e.g. a replay capture) or a CSV of KDD features; an optional label
+column holds the expected class.
+
+    python -m benchmarks.model_variants --dataset capture.jsonl
+    python -m benchmarks.model_variants --dataset kdd_test.csv --label-column label \\
+        --batch-sizes 1,15,128 --json results/model_variants.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(REPO_ROOT, "trained_models")
+DEFAULT_REFERENCE = "cnn/2505_combined_full"
+
+
+def find_bundles(models_dir: str) -> List[str]:
+    """Bundle directories under models_dir, as paths relative to it"""
+    bundles = []
+    for root, _, files in os.walk(models_dir):
+        if "model.h5" in files:
+            bundles.append(os.path.relpath(root, models_dir))
+    return sorted(bundles)
+
+
+def load_dataset(path: str, label_column: str, rows: Optional[int]):
+    """
+    Feature rows and optional labels of a dataset
+
+    :return: (DataFrame of features, list of labels or None)
+    """
+    if path.endswith(".csv"):
+        frame = pd.read_csv(path, nrows=rows)
+    else:
+        records = []
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    # Packet messages carry metadata next to the features
+                    record.pop("additional_data", None)
+                    record.pop("evaluation_time", None)
+                    records.append(record)
+                    if rows and len(records) >= rows:
+                        break
+        frame = pd.DataFrame(records)
+
+    labels = None
+    if label_column in frame.columns:
+        labels = frame.pop(label_column).astype(str).tolist()
+    return frame, labels
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_worker(args: argparse.Namespace):
+    """Benchmark the bundle in MODEL_BUNDLE_PATH and write the results as JSON"""
+    frame, _ = load_dataset(args.dataset, args.label_column, args.rows)
+    # TensorFlow itself is imported outside the timed region, which only
+    # covers loading and warming up the bundle
+    import tensorflow  # noqa: F401
+    rss_before = rss_mb()
+
+    started = time.perf_counter()
+    from app.models.model import predict
+    load_seconds = time.perf_counter() - started
+    rss_loaded = rss_mb()
+
+    # Full pass, also used for agreement and accuracy
+    predictions = [p["predicted_class"] for p in predict(frame)]
+
+    latency = {}
+    for batch_size in args.batch_sizes:
+        timings = []
+        rows = 0
+        deadline = time.perf_counter() + args.seconds
+        offset = 0
+        while time.perf_counter() < deadline or len(timings) < 5:
+            if offset + batch_size > len(frame):
+                offset = 0
+            batch = frame.iloc[offset:offset + batch_size]
+            offset += batch_size
+
+            call_started = time.perf_counter()
+            predict(batch)
+            timings.append(time.perf_counter() - call_started)
+            rows += len(batch)
+
+        timings = np.array(timings) * 1000
+        latency[batch_size] = {
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p99_ms": float(np.percentile(timings, 99)),
+            "rows_per_sec": rows / (timings.sum() / 1000),
+        }
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "load_seconds": load_seconds,
+            "rss_mb": rss_mb(),
+            "model_rss_mb": rss_loaded - rss_before,
+            "latency": latency,
+            "predictions": predictions,
+        }, f)
+
+
+def benchmark_bundle(bundle: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the worker for one bundle in a fresh process"""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as output:
+        output_path = output.name
+
+    env = dict(os.environ,
+               MODEL_BUNDLE_PATH=os.path.join(args.models_dir, bundle),
+               INFERENCE_WORKERS="0",
+               PYTHONPATH=REPO_ROOT)
+    command = [sys.executable, "-m", "benchmarks.model_variants", "--worker",
+               "--dataset", args.dataset, "--label-column", args.label_column,
+               "--batch-sizes", ",".join(str(size) for size in args.batch_sizes),
+               "--seconds", str(args.seconds), "--output", output_path]
+    if args.rows:
+        command += ["--rows", str(args.rows)]
+
+    try:
+        subprocess.run(command, env=env, cwd=REPO_ROOT, check=True)
+        with open(output_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(output_path)
+
+
+def print_table(results: Dict[str, Dict[str, Any]], batch_sizes: List[int], reference: str):
+    columns = ["bundle", "load s", "rss MB", "agree %", "accuracy %"]
+    for size in batch_sizes:
+        columns += [f"b{size} p50 ms", f"b{size} p99 ms", f"b{size} rows/s"]
+
+    rows = []
+    for bundle, result in results.items():
+        row = [bundle + (" (ref)" if bundle == reference else ""),
+               f"{result['load_seconds']:.2f}", f"{result['rss_mb']:.0f}",
+               "-" if result["agreement"] is None else f"{result['agreement'] * 100:.2f}",
+               "-" if result["accuracy"] is None else f"{result['accuracy'] * 100:.2f}"]
+        for size in batch_sizes:
+            latency = result["latency"][str(size)]
+            row += [f"{latency['p50_ms']:.2f}", f"{latency['p99_ms']:.2f}", f"{latency['rows_per_sec']:,.0f}"]
+        rows.append(row)
+
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("| " + " | ".join(column.ljust(width) for column, width in zip(columns, widths)) + " |")
+    print("|" + "|".join("-" * (width + 2) for width in widths) + "|")
+    for row in rows:
+        print("| " + " | ".join(value.ljust(width) for value, width in zip(row, widths)) + " |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", required=True, help="JSONL packet messages or CSV of KDD features")
+    parser.add_argument("--label-column", default="label", help="Expected class column, optional")
+    parser.add_argument("--rows", type=int, help="Only use the first N rows")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--bundles", help="Comma separated bundles relative to --models-dir (default: all)")
+    parser.add_argument("--reference", default=DEFAULT_REFERENCE, help="Bundle the others are compared to")
+    parser.add_argument("--batch-sizes", default="1,15,128,512",
+                        type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--seconds", type=float, default=3.0, help="Timed duration per batch size")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    bundles = args.bundles.split(",") if args.bundles else find_bundles(args.models_dir)
+    if args.reference not in bundles:
+        bundles.insert(0, args.reference)
+    _, labels = load_dataset(args.dataset, args.label_column, args.rows)
+
+    results = {}
+    for bundle in bundles:
+        print(f"Benchmarking {bundle} ...", file=sys.stderr)
+        results[bundle] = benchmark_bundle(bundle, args)
+
+    reference = np.array(results[args.reference]["predictions"])
+    for result in results.values():
+        predictions = np.array(result.pop("predictions"))
+        result["agreement"] = float(np.mean(predictions == reference)) if len(reference) else None
+        result["accuracy"] = float(np.mean(predictions == np.array(labels))) if labels else None
+
+    print_table(results, args.batch_sizes, args.reference)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"timestamp": time.time(), "dataset": args.dataset,
+                       "reference": args.reference, "bundles": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Write throughput of the MongoDB write profiles against a local mongod.
+
+Uses the same client factory and settings (MONGO_* environment variables)
+as the application, point MONGO_HOST at a local instance, e.g. the one from
+docker-compose:
+
+    MONGO_HOST=localhost python -m benchmarks.mongo_write_profiles --writes 20000
+
+Every profile runs two workloads on a scratch collection that is dropped
+afterwards: plain inserts (alerts) and $inc upserts on a few documents
+(statistics deltas).
+"""
+import argparse
+import asyncio
+import time
+
+from app.mongodb import WRITE_PROFILES, get_mongodb_client, close_mongodb_client
+
+SCRATCH_COLLECTION = "benchmark_write_profiles"
+
+
+async def run_workload(collection, workload: str, writes: int, concurrency: int) -> float:
+    """Run ``writes`` operations, ``concurrency`` at a time, return writes/sec"""
+    async def write(i: int):
+        if workload == "insert":
+            await collection.insert_one({
+                "ipsrc": "10.0.0.1", "ipdst": "10.0.0.2", "dport": i % 1024,
+                "predicted_class": "Dos", "confidence": 0.98, "timestamp": time.time()
+            })
+        else:
+            await collection.update_one(
+                {"_id": f"counter-{i % 16}"},
+                {"$inc": {"pkt_in": 1, f"top_ports.{i % 1024}": 1}},
+                upsert=True
+            )
+
+    started = time.perf_counter()
+    for start in range(0, writes, concurrency):
+        await asyncio.gather(*(write(i) for i in range(start, min(start + concurrency, writes))))
+    return writes / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writes", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--profiles", nargs="*", default=list(WRITE_PROFILES))
+    args = parser.parse_args()
+
+    client = get_mongodb_client()
+    rows = []
+    try:
+        for profile in args.profiles:
+            for workload in ("insert", "upsert"):
+                await client.db.drop_collection(SCRATCH_COLLECTION)
+                collection = client.collection(SCRATCH_COLLECTION, profile)
+                rate = await run_workload(collection, workload, args.writes, args.concurrency)
+                rows.append((profile, str(WRITE_PROFILES[profile].document or "{}"), workload, rate))
+    finally:
+        await client.db.drop_collection(SCRATCH_COLLECTION)
+        await close_mongodb_client()
+
+    print(f"{'profile':<10} {'write concern':<28} {'workload':<8} {'writes/sec':>12}")
+    for profile, concern, workload, rate in rows:
+        print(f"{profile:<10} {concern:<28} {workload:<8} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
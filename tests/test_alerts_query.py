@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from app.alert_store import RecentAlertStore
+from app.mongodb import MongoDBClient
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def skip(self, offset):
+        self.documents = self.documents[offset:]
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _AlertsCollection:
+    """Evaluates the equality and $in filters get_alerts builds"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection=None):
+        def matches(document):
+            for field, condition in query.items():
+                value = document.get(field)
+                if field == "timestamp":
+                    if not condition["$gte"] <= value < condition["$lt"]:
+                        return False
+                elif isinstance(condition, dict):
+                    if value not in condition["$in"]:
+                        return False
+                elif value != condition:
+                    return False
+            return True
+
+        found = [document for document in self.documents if matches(document)]
+        return _Cursor(sorted(found, key=lambda document: -document["timestamp"]))
+
+
+def test_mongodb_fallback_matches_numeric_and_string_ports():
+    now = time.time()
+    alerts = [
+        {"timestamp": now - 2, "ipsrc": "1.2.3.4", "dport": 22, "predicted_class": "R2L"},
+        {"timestamp": now - 1, "ipsrc": "1.2.3.4", "dport": "22", "predicted_class": "R2L"},
+        {"timestamp": now, "ipsrc": "1.2.3.4", "dport": "23", "predicted_class": "R2L"},
+    ]
+    client = MongoDBClient.__new__(MongoDBClient)
+    client.non_normal_packets_collection = _AlertsCollection(alerts)
+
+    # Older range served by MongoDB
+    stored = asyncio.run(client.get_alerts(now - 10, now + 1, {"dport": 22}))
+    assert [alert["timestamp"] for alert in stored] == [now - 1, now - 2]
+
+    # Recent range served from memory returns the same alerts
+    store = RecentAlertStore()
+    store.add(alerts)
+    recent = store.query(now - 10, now + 1, {"dport": 22})
+    assert recent == stored
+
+    by_string = asyncio.run(client.get_alerts(now - 10, now + 1, {"dport": "22", "ipsrc": "1.2.3.4"}))
+    assert by_string == stored
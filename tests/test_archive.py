@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.archive import TrafficArchiver, _partition, archive_table
+
+
+def test_mixed_rows_keep_every_column(tmp_path):
+    now = time.time()
+    # The first row is outbound: no evaluation times, no flood_hold, string port
+    rows = [
+        {"timestamp": now, "ipsrc": "10.0.0.5", "ipdst": "8.8.8.8", "dport": "53",
+         "protocol_type": "udp", "service": "domain", "len": 80,
+         "predicted_class": "normal", "confidence": 0.0},
+        {"timestamp": now + 1, "ipsrc": "1.2.3.4", "ipdst": "10.0.0.5", "dport": 80,
+         "protocol_type": "tcp", "service": "http", "len": 60,
+         "predicted_class": "Dos", "confidence": 0.99, "flood_hold": True,
+         "t1": 1.0, "t2": 2.0, "t3": 3.0, "unknown": "dropped"},
+    ]
+    archiver = TrafficArchiver(path=str(tmp_path))
+    # One segment per row, as if they were flushed apart
+    for row in rows:
+        archiver._buffers = {_partition(row["timestamp"]): [row]}
+        archiver._flush()
+    assert archiver.written_rows == 2
+
+    table = archiver.query(now - 1, now + 2)
+    read = sorted(table.to_pylist(), key=lambda row: row["timestamp"])
+    assert [row["dport"] for row in read] == [53, 80]
+    assert read[0]["flood_hold"] is None and read[0]["t1"] is None
+    assert read[1]["flood_hold"] is True
+    assert (read[1]["t1"], read[1]["t2"], read[1]["t3"]) == (1.0, 2.0, 3.0)
+    assert "unknown" not in table.column_names
+
+    filtered = archiver.query(now - 1, now + 2, columns=["ipsrc"], filters={"dport": [53]})
+    assert filtered.to_pylist() == [{"ipsrc": "10.0.0.5"}]
+
+
+def test_unconvertible_values_become_null():
+    table = archive_table([{"dport": "http", "len": None, "confidence": "0.5"}])
+    row = table.to_pylist()[0]
+    assert row["dport"] is None
+    assert row["len"] is None
+    assert row["confidence"] == 0.5
@@ -0,0 +1,61 @@
+from app.preprocessing.flow_table import FlowTable
+
+
+def _record(ts, ipdst, service, flag="SF", sport=40000):
+    return {
+        "timestamp": ts,
+        "ipsrc": "10.0.0.1",
+        "ipdst": ipdst,
+        "sport": sport,
+        "dport": 80,
+        "protocol_type": "tcp",
+        "service": service,
+        "flag": flag,
+        "len": 60,
+    }
+
+
+def test_host_window_service_features_count_any_destination():
+    # Four http connections to four hosts (two SYN errors, one REJ), then smtp to the last host
+    records = [
+        _record(0.0, "10.0.0.10", "http", "S0"),
+        _record(0.1, "10.0.0.11", "http", "S0"),
+        _record(0.2, "10.0.0.12", "http", "SF"),
+        _record(0.3, "10.0.0.13", "http", "REJ"),
+        _record(0.4, "10.0.0.13", "smtp", "SF"),
+    ]
+    rows = FlowTable().ingest(records).to_dict("records")
+
+    # Fourth connection: 1 of the last connections to its host, 4 to http on any host
+    http = rows[3]
+    assert http["count"] == 1
+    assert http["srv_count"] == 4
+    assert http["srv_diff_host_rate"] == 0.75
+    assert http["dst_host_count"] == 1
+    assert http["dst_host_srv_count"] == 4
+    assert http["dst_host_same_srv_rate"] == 1.0
+    assert http["dst_host_srv_diff_host_rate"] == 0.75
+    assert http["dst_host_srv_serror_rate"] == 0.5
+    assert http["dst_host_srv_rerror_rate"] == 0.25
+    assert http["dst_host_rerror_rate"] == 1.0
+
+    # Fifth connection: 2 to its host (http and smtp), smtp seen once anywhere
+    smtp = rows[4]
+    assert smtp["dst_host_count"] == 2
+    assert smtp["dst_host_srv_count"] == 1
+    assert smtp["dst_host_same_srv_rate"] == 0.5
+    assert smtp["dst_host_diff_srv_rate"] == 0.5
+    assert smtp["dst_host_srv_diff_host_rate"] == 0.0
+    assert smtp["dst_host_srv_serror_rate"] == 0.0
+    assert smtp["dst_host_rerror_rate"] == 0.5
+
+
+def test_host_window_only_holds_the_last_connections():
+    table = FlowTable(capacity=8, host_window=4)
+    records = [_record(float(i), "10.0.0.10", "http") for i in range(6)]
+    row = table.ingest(records).to_dict("records")[-1]
+
+    assert row["dst_host_count"] == 4
+    assert row["dst_host_srv_count"] == 4
+    # The time window still sees the 2 seconds before the last connection
+    assert row["count"] == 3
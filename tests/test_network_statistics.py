@@ -0,0 +1,64 @@
+import asyncio
+
+from app.network_statistics import network_stats_service
+from app.networks import DIRECTION_INBOUND, parse_ip
+
+
+def _result(dport):
+    return {"ipsrc": "1.2.3.4", "ipdst": "10.0.0.5", "dport": dport, "len": 60,
+            "protocol_type": "tcp", "service": "http", "predicted_class": "normal"}
+
+
+def test_batch_counts_packets_without_a_valid_port():
+    network_stats_service._initialize()
+    addresses = (parse_ip("1.2.3.4"), parse_ip("10.0.0.5"), DIRECTION_INBOUND)
+    results = [_result(80), _result(None), _result(""), _result("x"), _result("80")]
+
+    asyncio.run(network_stats_service.update_statistics_batch(results, [addresses] * len(results)))
+
+    assert network_stats_service.packet_counter == 5
+    assert network_stats_service.top_ports == {80: 2}
+    assert network_stats_service.top_talkers == {addresses[0]: 300}
+    network_stats_service._initialize()
+
+
+def test_snapshot_restores_live_totals_and_buffers_only():
+    network_stats_service._initialize()
+    network_stats_service.live_totals["pkt_in"] = 1000
+    network_stats_service.live_totals["top_ports"] = {22: 5}
+    network_stats_service.all_packets = [{"len": 60}]
+    # Not flushed yet, MongoDB may already have it by the time of a crash
+    network_stats_service.in_size = 500
+    state = network_stats_service.export_state()
+    state["get_statistics"] = None
+    state["in_size"] = 500
+
+    network_stats_service._initialize()
+    network_stats_service.restore_state(state)
+
+    assert network_stats_service.live_totals["pkt_in"] == 1000
+    assert network_stats_service.live_totals["top_ports"] == {22: 5}
+    assert network_stats_service.all_packets == [{"len": 60}]
+    assert network_stats_service.in_size == 0
+    assert callable(network_stats_service.get_statistics)
+    network_stats_service._initialize()
+
+
+def test_batch_alerts_are_inserted_together(monkeypatch):
+    inserted = []
+
+    class _MongoDB:
+        async def batch_insert_non_normal_packets(self, packets):
+            inserted.append(list(packets))
+
+    monkeypatch.setattr(type(network_stats_service), "mongodb", _MongoDB())
+    network_stats_service._initialize()
+    addresses = (parse_ip("1.2.3.4"), parse_ip("10.0.0.5"), DIRECTION_INBOUND)
+    results = [_result(22), _result(23), _result(80)]
+    results[0]["predicted_class"] = "R2L"
+    results[1]["predicted_class"] = "Probe"
+
+    asyncio.run(network_stats_service.update_statistics_batch(results, [addresses] * len(results)))
+
+    assert inserted == [results[:2]]
+    network_stats_service._initialize()
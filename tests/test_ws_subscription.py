@@ -0,0 +1,15 @@
+from app.api.websockets.ws import Subscription
+from app.networks import parse_ip
+
+SRC = parse_ip("1.2.3.4")
+DST = parse_ip("10.0.0.5")
+
+
+def test_port_filter_matches_string_ports():
+    subscription = Subscription.from_message({"type": "subscribe", "ports": [22]})
+
+    assert subscription.matches({"dport": "22", "sport": "51000"}, SRC, DST)
+    assert subscription.matches({"dport": 22}, SRC, DST)
+    assert subscription.matches({"dport": "443", "sport": "22"}, SRC, DST)
+    assert not subscription.matches({"dport": "443", "sport": "51000"}, SRC, DST)
+    assert not subscription.matches({"dport": "", "sport": None}, SRC, DST)